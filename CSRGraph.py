@@ -0,0 +1,209 @@
+'''
+Compressed sparse row (CSR) representation of a weighted directed graph.
+Nodes are mapped to a dense index range, out-edges of node i are stored in indices[indptr[i]:indptr[i+1]].
+Graphs can be stored on disk as a directory of .npy arrays and memory-mapped on load.
+'''
+
+import os
+import json
+import time
+import numpy as np
+import networkx as nx
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import dijkstra
+
+class CSRGraph:
+
+    ARRAYS = ["indptr", "indices", "weights", "node_ids"]
+
+    def __init__(self, indptr, indices, weights, node_ids, graph=None):
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self.node_ids = node_ids
+        self.graph = {} if graph is None else graph
+        # integer ids 0..n-1 are their own indices, any other ids are mapped with a dictionary
+        self.is_identity = node_ids.dtype.kind in 'iu' and np.array_equal(node_ids, np.arange(len(node_ids)))
+        # sorted ids (as from from_edges) are found by binary search instead of a dictionary of all nodes
+        self.is_sorted = node_ids.dtype.kind in 'iuf' and bool(np.all(node_ids[1:] > node_ids[:-1]))
+        self._node_index = None
+        self._sources = None
+
+    @staticmethod
+    def from_networkx(G, weight='weight'):
+        nodes = list(G.nodes())
+        node_index = {n: i for i, n in enumerate(nodes)}
+        out_degrees = np.fromiter((len(G.adj[n]) for n in nodes), dtype=np.int64, count=len(nodes))
+        indptr = np.zeros(len(nodes) + 1, dtype=np.int64)
+        np.cumsum(out_degrees, out=indptr[1:])
+        indices = np.fromiter((node_index[u] for n in nodes for u in G.adj[n]), dtype=np.int64, count=indptr[-1])
+        weights = np.fromiter((d.get(weight, 1.) for n in nodes for d in G.adj[n].values()), dtype=np.float64, count=indptr[-1])
+        return CSRGraph(indptr, indices, weights, np.array(nodes), dict(G.graph))
+
+    @staticmethod
+    def from_edges(sources, targets, weights, node_ids=None, graph=None):
+        '''
+        Builds the graph from edge arrays of node ids, node_ids must be sorted and by default are the ids of all edge ends
+        '''
+        if node_ids is None:
+            node_ids, ends = np.unique(np.concatenate([sources, targets]), return_inverse=True)
+            sources, targets = ends[:len(sources)], ends[len(sources):]
+        else:
+            sources = np.searchsorted(node_ids, sources)
+            targets = np.searchsorted(node_ids, targets)
+        order = np.argsort(sources, kind='stable')
+        indptr = np.zeros(len(node_ids) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(sources, minlength=len(node_ids)), out=indptr[1:])
+        return CSRGraph(indptr, targets[order].astype(np.int64), np.asarray(weights, dtype=np.float64)[order], node_ids, graph)
+
+    def to_networkx(self):
+        G = nx.DiGraph()
+        G.add_nodes_from(self.node_ids.tolist())
+        G.add_weighted_edges_from(zip(self.to_nodes(self.get_sources()).tolist(), self.to_nodes(self.indices).tolist(), self.weights.tolist()))
+        G.graph.update(self.graph)
+        return G
+
+    def save(self, path):
+        if self.node_ids.dtype.kind == 'O':
+            raise Exception("Only numeric or string node ids can be stored")
+        os.makedirs(path, exist_ok=True)
+        for name in CSRGraph.ARRAYS:
+            np.save(os.path.join(path, name + ".npy"), getattr(self, name))
+        json.dump(self.graph, open(os.path.join(path, "graph.json"), "w"), default=str)
+
+    @staticmethod
+    def load(path, mmap=True):
+        arrays = [np.load(os.path.join(path, name + ".npy"), mmap_mode='r' if mmap else None) for name in CSRGraph.ARRAYS]
+        return CSRGraph(*arrays, graph=json.load(open(os.path.join(path, "graph.json"))))
+
+    def save_edgelist(self, path):
+        # one "source target weight" line per edge, readable by nx.read_weighted_edgelist
+        np.savetxt(path, np.column_stack([self.to_nodes(self.get_sources()), self.to_nodes(self.indices), self.weights]),
+                   fmt=["%d", "%d", "%.17g"] if self.node_ids.dtype.kind in 'iu' else "%s")
+
+    @staticmethod
+    def is_store(path):
+        return os.path.isfile(os.path.join(path, "indptr.npy"))
+
+    def __len__(self):
+        return len(self.node_ids)
+
+    def __iter__(self):
+        return iter(self.node_ids.tolist())
+
+    def __contains__(self, node):
+        return self.has_node(node)
+
+    def has_node(self, node):
+        if self.is_identity:
+            return node == int(node) and 0 <= node < len(self)
+        if self.is_sorted:
+            i = np.searchsorted(self.node_ids, node)
+            return bool(i < len(self) and self.node_ids[i] == node)
+        return node in self.node_index
+
+    def nodes(self):
+        return self.node_ids.tolist()
+
+    def neighbors(self, node):
+        i = self.to_index([node])[0]
+        return self.to_nodes(self.indices[self.indptr[i]:self.indptr[i+1]]).tolist()
+
+    def number_of_edges(self):
+        return len(self.indices)
+
+    @property
+    def node_index(self):
+        if self._node_index is None:
+            self._node_index = {n: i for i, n in enumerate(self.node_ids.tolist())}
+        return self._node_index
+
+    def get_sources(self):
+        # source node index of every edge, aligned with indices and weights
+        if self._sources is None:
+            self._sources = np.repeat(np.arange(len(self), dtype=np.int64), np.diff(self.indptr))
+        return self._sources
+
+    def get_degrees(self):
+        # in-degree plus out-degree, as the degree of a NetworkX DiGraph
+        return np.diff(self.indptr) + np.bincount(self.indices, minlength=len(self))
+
+    def reverse(self):
+        '''
+        Returns the graph with all edges reversed, with the same node indices
+        '''
+        order = np.argsort(self.indices, kind='stable')
+        indptr = np.zeros(len(self) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.indices, minlength=len(self)), out=indptr[1:])
+        return CSRGraph(indptr, self.get_sources()[order], self.weights[order], self.node_ids, self.graph)
+
+    def subgraph(self, mask):
+        '''
+        Returns the graph induced by the nodes in the boolean mask, with node indices remapped to a dense range
+        and the same node ids
+        '''
+        index = np.cumsum(mask, dtype=np.int64) - 1
+        sources = self.get_sources()
+        kept = mask[sources] & mask[self.indices]
+        indptr = np.zeros(int(mask.sum()) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(index[sources[kept]], minlength=len(indptr) - 1), out=indptr[1:])
+        return CSRGraph(indptr, index[self.indices[kept]], self.weights[kept], self.node_ids[mask], dict(self.graph))
+
+    def get_reachable(self, sources, max_hops=None, min_probability=None):
+        '''
+        Returns the mask of nodes reachable from the source node indices over edges with a positive probability,
+        within max_hops edges and only through nodes whose most probable path from the sources has at least min_probability
+        '''
+        allowed = np.ones(len(self), dtype=bool)
+        if min_probability is not None:
+            lengths = -np.log(np.clip(self.weights, np.finfo(np.float64).tiny, 1.))
+            # explicit zeros are not edges for csgraph, edges with probability 1 get a negligible length instead
+            lengths = np.maximum(lengths, np.finfo(np.float64).eps)
+            A = csr_matrix((lengths, self.indices, self.indptr), shape=(len(self), len(self)))
+            distances = dijkstra(A, indices=sources, min_only=True, limit=-np.log(min_probability))
+            allowed = np.isfinite(distances)
+        reached = np.zeros(len(self), dtype=bool)
+        reached[sources] = True
+        front = np.unique(sources)
+        hops = 0
+        while len(front) > 0 and (max_hops is None or hops < max_hops):
+            edges = self.get_out_edges(front)
+            targets = np.unique(self.indices[edges[self.weights[edges] > 0]])
+            front = targets[~reached[targets] & allowed[targets]]
+            reached[front] = True
+            hops += 1
+        return reached
+
+    def prune(self, seeds, max_hops=None, min_probability=None):
+        '''
+        Returns the subgraph of nodes reachable from the seed nodes (see get_reachable) and its size relative to the graph
+        '''
+        t1 = time.time()
+        pruned = self.subgraph(self.get_reachable(self.to_index(seeds), max_hops, min_probability))
+        stats = {'nodes': len(pruned), 'edges': pruned.number_of_edges(), 'node ratio': len(pruned)/len(self),
+                 'edge ratio': pruned.number_of_edges()/max(self.number_of_edges(), 1), 'time': time.time() - t1}
+        return pruned, stats
+
+    def get_out_edges(self, frontier):
+        '''
+        Returns edge ids of all out-edges of the frontier node indices as one array.
+        '''
+        starts = self.indptr[frontier]
+        counts = self.indptr[frontier + 1] - starts
+        total = counts.sum()
+        offsets = np.repeat(starts - (np.cumsum(counts) - counts), counts)
+        return offsets + np.arange(total, dtype=np.int64)
+
+    def to_index(self, nodes):
+        if self.is_identity:
+            return np.asarray(list(nodes)).astype(np.int64)
+        if self.is_sorted:
+            nodes = np.asarray(list(nodes))
+            indices = np.minimum(np.searchsorted(self.node_ids, nodes), max(len(self) - 1, 0))
+            if len(nodes) > 0 and np.any(self.node_ids[indices] != nodes):
+                raise KeyError(nodes[self.node_ids[indices] != nodes][0])
+            return indices.astype(np.int64)
+        return np.array([self.node_index[n] for n in nodes], dtype=np.int64)
+
+    def to_nodes(self, node_indices):
+        return self.node_ids[node_indices]
@@ -3,15 +3,24 @@ import time
 from Solver import *
 
 class DegreeSolver(Solver):
+    supports_csr = True
+    prefix_solutions = True
 
     def run(self):
         t1 = time.time()
-        degrees = [(node, self.G.degree([node])[node]) for node in self.G.nodes() if node not in self.seeds]
+        degrees = list(self.get_cached("degrees", self.get_sorted_degrees))
         blocked = []
-        degrees.sort(key=lambda t: t[1])
         for i in range(self.k):
             blocked.append(degrees.pop()[0])
         t2 = time.time()
 
         self.log['Total time'] = (t2-t1)
         self.log['Blocked nodes'] = [int(node) for node in blocked]
+
+    def get_sorted_degrees(self):
+        if isinstance(self.G, CSRGraph):
+            degrees = [(node, degree) for node, degree in zip(self.G.nodes(), self.G.get_degrees().tolist()) if node not in self.seeds]
+        else:
+            degrees = [(node, self.G.degree([node])[node]) for node in self.G.nodes() if node not in self.seeds]
+        degrees.sort(key=lambda t: t[1])
+        return degrees
@@ -2,42 +2,56 @@
 The class implements DAVA - the seed-aware immunization algorithm based on dominator trees.
 '''
 
-import networkx as nx
 import time
-from collections import defaultdict
 import sys
 import os
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 import Solver as slv
-from functools import reduce
-import math
 import numpy as np
+from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import depth_first_order, dijkstra
 
 class DomSolver(slv.Solver):
+    '''
+    Parameters:
+    fast: block the k best nodes of the first dominator tree instead of rebuilding the tree after every blocked node
+    '''
+    supports_csr = True
+    prefix_solutions = True
 
     def clear(self):
-        for e in self.G.edges(data=True):
-            if e[2]['weight'] == 1:
-                e[2]['weight'] = 0.99999  # No p=1 allowed due to probability calculation along shortest path
-        self.create_superseed_and_update_weights()
-
-    def create_superseed_and_update_weights(self):
-        self.superseed_index = len(self.G)
-        while self.superseed_index in self.G:
+        self.create_superseed_csr()
+
+    def create_superseed_csr(self):
+        '''
+        The superseed replaces the seeds: its edge to a node has the probability that at least one seed activates the node.
+        Edge lengths are -log probabilities (p=1 is not allowed due to probability calculation along shortest path),
+        as arrays aligned with the CSR graph. Seeds and blocked nodes are marked as removed.
+        '''
+        self.csr = self.get_csr()
+        self.superseed_index = len(self.csr)
+        while self.superseed_index in self.csr:
             self.superseed_index += 1
-        neighbors = defaultdict(lambda: [])
-        for seed in self.seeds:
-            for n in self.G.neighbors(seed):
-                neighbors[n].append(self.G[seed][n]['weight'])
-        new_edges = [(self.superseed_index, n, DomSolver.get_total_weight(neighbors[n])) for n in neighbors]
-        self.G.add_weighted_edges_from(new_edges)
-        self.G = self.G.subgraph((set(self.G.nodes()) - set(self.seeds)) | set([self.superseed_index])).copy()
-        for edge in self.G.edges():
-            self.G[edge[0]][edge[1]]['weight'] = -math.log(self.G[edge[0]][edge[1]]['weight'])
+        probabilities = np.where(self.csr.weights == 1, 0.99999, self.csr.weights)
+        self.lengths = -np.log(probabilities)
+        seed_indices = self.csr.to_index(self.seeds)
+        edges = self.csr.get_out_edges(np.unique(seed_indices))
+        # probability that at least one seed activates the neighbor
+        not_activated = np.bincount(self.csr.indices[edges], weights=np.log1p(-probabilities[edges]), minlength=len(self.csr))
+        self.root_targets = np.unique(self.csr.indices[edges])
+        self.root_lengths = -np.log(-np.expm1(not_activated[self.root_targets]))
+        self.removed = np.zeros(len(self.csr), dtype=bool)
+        self.removed[seed_indices] = True
 
-    @staticmethod
-    def get_total_weight(list_of_probabilities):
-        return 1. - reduce(lambda x, y: x*y, [(1.-p) for p in list_of_probabilities])
+    def remove_node(self, node):
+        self.removed[self.csr.to_index([node])] = True
+
+    def get_graph_size(self):
+        # number of nodes left in the graph, with the superseed
+        return int(len(self.removed) - self.removed.sum()) + 1
+
+    def get_remaining_nodes(self):
+        return self.csr.node_ids[~self.removed].tolist()
 
     def run(self):
         t1 = time.time()
@@ -46,15 +60,15 @@ class DomSolver(slv.Solver):
 
         if not self.params.get("fast", False):
             for iteration in range(self.k):
-                self.build_domtree()
+                self.build_domtree_csr()
                 if iteration == 0:
                     extra_time += self.save_tree_stats_return_time("first it")
                 if iteration == self.k - 1:
                     extra_time += self.save_tree_stats_return_time("last it")
                 blocked += self.get_best_nodes(1)
-                self.G.remove_node(blocked[-1])
+                self.remove_node(blocked[-1])
         else:
-            self.build_domtree()
+            self.set_tree(self.get_cached("domtree", self.get_tree))
             extra_time += self.save_tree_stats_return_time("first it")
             blocked = self.get_best_nodes(self.k)
         t2 = time.time()
@@ -63,49 +77,167 @@ class DomSolver(slv.Solver):
 
     def save_tree_stats_return_time(self, prefix):
         t1 = time.time()
-        g = self.domtree
-        sp = nx.single_source_shortest_path_length(g,self.superseed_index)
-        self.log['tree depth ' + prefix] = max([sp[n] for n in sp])
-        self.log['first level node fraction ' + prefix] = g.degree(self.superseed_index)/len(self.G)
-        first_level_degrees = [g.out_degree(n) for n in g.neighbors(self.superseed_index)]
-        self.log['second level node fraction ' + prefix] = sum(first_level_degrees)/len(self.G)
-        self.log['second level avg degree ' + prefix] = 0 if len(first_level_degrees) == 0 else np.mean(first_level_degrees)
+        level_sizes = np.diff(self.tree_level_starts)
+        first_level_size = level_sizes[1] if len(level_sizes) > 1 else 0
+        second_level_size = level_sizes[2] if len(level_sizes) > 2 else 0
+        self.log['tree depth ' + prefix] = int(self.tree_depth[-1])
+        self.log['first level node fraction ' + prefix] = first_level_size/self.get_graph_size()
+        self.log['second level node fraction ' + prefix] = second_level_size/self.get_graph_size()
+        self.log['second level avg degree ' + prefix] = 0 if first_level_size == 0 else second_level_size/first_level_size
         t2 = time.time()
         return t2 - t1
 
-    def build_domtree(self):
-        tree_dict = nx.algorithms.dominance.immediate_dominators(self.G, self.superseed_index)
-        self.domtree = nx.DiGraph()
-        self.domtree.add_node(self.superseed_index)
-        self.domtree.add_edges_from([(edge[1],edge[0]) for edge in tree_dict.items() if edge[0] != edge[1]])
-        probabilities_from_root = nx.single_source_dijkstra_path_length(self.G, self.superseed_index)
-
-        #probability (v,u) = p(u)/p(v) from root
-        for edge in self.domtree.edges():
-            if edge[0] == self.superseed_index:
-                probability = math.exp(-probabilities_from_root[edge[1]])
-            else:
-                probability = math.exp(-probabilities_from_root[edge[1]]+probabilities_from_root[edge[0]])
-            self.domtree[edge[0]][edge[1]]['weight'] = probability
-
-    def traverseTreeRec(self, node):
-        benefit = 1
-        for n in self.domtree.neighbors(node):
-            benefit += self.traverseTreeRec(n)*self.domtree[node][n]['weight']
-        return benefit
+    def build_domtree_csr(self):
+        '''
+        The dominator tree of the nodes reachable from the superseed (semi-NCA) and the shortest -log paths from it
+        (csgraph Dijkstra), flattened into arrays in breadth-first order (root at index 0, levels are contiguous)
+        '''
+        A = self.get_adjacency()
+        root = A.shape[0] - 1
+        order, dfs_parent = depth_first_order(A, root, directed=True, return_predecessors=True)
+        idom = DomSolver.get_immediate_dominators_csr(A, order, dfs_parent)
+        distances = dijkstra(A, indices=root)[order]
+
+        depth = DomSolver.get_tree_depth(idom)
+        bfs = np.argsort(depth, kind='stable')
+        position = np.empty(len(bfs), dtype=np.int64)
+        position[bfs] = np.arange(len(bfs))
+        self.tree_nodes = np.concatenate([[self.superseed_index], self.csr.node_ids[order[bfs[1:]]]])
+        self.tree_parent = position[idom[bfs]]
+        self.tree_parent[0] = -1
+        self.tree_depth = depth[bfs]
+        # probability of the path to the child through its dominator: p(child)/p(parent) from root
+        self.tree_weight = np.exp(-distances[bfs] + distances[idom[bfs]])
+        self.tree_weight[0] = 1.
+        self.compute_level_benefits()
+
+    def get_adjacency(self):
+        '''
+        Sparse matrix of -log weights of the edges between remaining nodes, the superseed is the last row
+        '''
+        csr = self.csr
+        sources = csr.get_sources()
+        kept = ~self.removed[sources] & ~self.removed[csr.indices]
+        root_kept = ~self.removed[self.root_targets]
+        indptr = np.zeros(len(csr) + 2, dtype=np.int64)
+        np.cumsum(np.bincount(sources[kept], minlength=len(csr)), out=indptr[1:-1])
+        indptr[-1] = indptr[-2] + root_kept.sum()
+        indices = np.concatenate([csr.indices[kept], self.root_targets[root_kept]])
+        # explicit zeros are not edges for csgraph
+        lengths = np.maximum(np.concatenate([self.lengths[kept], self.root_lengths[root_kept]]), np.finfo(np.float64).tiny)
+        return csr_matrix((lengths, indices, indptr), shape=(len(csr) + 1, len(csr) + 1))
+
+    @staticmethod
+    def get_immediate_dominators_csr(A, order, dfs_parent):
+        '''
+        Semi-NCA algorithm (Georgiadis, Tarjan) over nodes numbered in the depth-first preorder of the sparse matrix A.
+        Semidominators are computed with the path compression of Lengauer and Tarjan, candidates from predecessors
+        that precede the node in preorder are taken in one vectorized step.
+        Returns the preorder number of the immediate dominator of every node in order, the root is its own dominator.
+        '''
+        m = len(order)
+        pre = np.full(A.shape[0], -1, dtype=np.int64)
+        pre[order] = np.arange(m)
+        sources = pre[np.repeat(np.arange(A.shape[0]), np.diff(A.indptr))]
+        targets = pre[A.indices]
+        reached = sources >= 0
+        sources, targets = sources[reached], targets[reached]
+
+        semi = np.arange(m)
+        forward = sources < targets
+        by_target = np.argsort(targets[forward], kind='stable')
+        forward_targets, first = np.unique(targets[forward][by_target], return_index=True)
+        if len(first) > 0:
+            semi[forward_targets] = np.minimum.reduceat(sources[forward][by_target], first)
+        backward = sources > targets
+        by_target = np.argsort(-targets[backward], kind='stable')
+        back_targets = targets[backward][by_target].tolist()
+        back_sources = sources[backward][by_target].tolist()
+
+        parent = np.concatenate([[0], pre[dfs_parent[order[1:]]]])
+        # nodes are linked to their parents in the forest of Lengauer and Tarjan in reverse preorder,
+        # so when w is processed exactly the nodes after w are linked, and only predecessors after w need the forest
+        ancestor = parent.tolist()
+        label = list(range(m))
+        semi = semi.tolist()
+        for w, v in zip(back_targets, back_sources):
+            # compress the path from v to the root of its tree in the forest, paths of one node without a list
+            a = ancestor[v]
+            if a > w and ancestor[a] > w:
+                path = [v, a]
+                u = ancestor[a]
+                while ancestor[u] > w:
+                    path.append(u)
+                    u = ancestor[u]
+                for x in reversed(path):
+                    a = ancestor[x]
+                    if semi[label[a]] < semi[label[x]]:
+                        label[x] = label[a]
+                    ancestor[x] = ancestor[a]
+            elif a > w:
+                if semi[label[a]] < semi[label[v]]:
+                    label[v] = label[a]
+                ancestor[v] = ancestor[a]
+            if semi[label[v]] < semi[w]:
+                semi[w] = semi[label[v]]
+
+        semi = np.array(semi, dtype=np.int64)
+        idom = parent.tolist()
+        # the immediate dominator is the nearest common ancestor of the parent and the semidominator in the tree built so far
+        for w in np.nonzero(semi < parent)[0].tolist():
+            x = idom[w]
+            while x > semi[w]:
+                x = idom[x]
+            idom[w] = x
+        return np.array(idom, dtype=np.int64)
+
+    @staticmethod
+    def get_tree_depth(parent):
+        # pointer jumping, the root is its own parent
+        depth = np.ones(len(parent), dtype=np.int64)
+        depth[0] = 0
+        jump = parent.copy()
+        while np.any(jump != 0):
+            depth += depth[jump]
+            jump = jump[jump]
+        return depth
+
+    TREE_ATTRIBUTES = ["tree_nodes", "tree_parent", "tree_depth", "tree_weight", "tree_level_starts", "tree_benefit"]
+
+    def get_tree(self):
+        self.build_domtree_csr()
+        return {name: getattr(self, name) for name in DomSolver.TREE_ATTRIBUTES}
+
+    def set_tree(self, tree):
+        # a shared tree is only read in the fast mode
+        for name in tree:
+            setattr(self, name, tree[name])
+
+    def compute_level_benefits(self):
+        '''
+        Benefit of every node, computed bottom-up one tree level at a time:
+        benefit(v) = 1 + sum over children c of benefit(c)*p(v,c)
+        '''
+        self.tree_level_starts = np.searchsorted(self.tree_depth, np.arange(self.tree_depth[-1] + 2))
+        self.tree_benefit = np.ones(len(self.tree_nodes))
+        for level in range(self.tree_depth[-1], 0, -1):
+            level_slice = slice(self.tree_level_starts[level], self.tree_level_starts[level+1])
+            np.add.at(self.tree_benefit, self.tree_parent[level_slice], self.tree_benefit[level_slice]*self.tree_weight[level_slice])
 
     def get_rank(self):
-        rank = []
-        if self.k > self.domtree.degree(self.superseed_index):
+        '''
+        Benefits and nodes of the first level of the dominator tree
+        '''
+        first_level_size = np.diff(self.tree_level_starts)[1] if len(self.tree_level_starts) > 2 else 0
+        if self.k > first_level_size:
             self.log['error'] = "Problem is trivial"
-            if self.domtree.degree(self.superseed_index) == 0:
-                return [(0,np.random.choice([n for n in self.G.nodes() if n != self.superseed_index and n not in self.seeds], replace=False))]
-            return [(0, next(self.domtree.neighbors(self.superseed_index)))]
-        for n in self.domtree.neighbors(self.superseed_index):
-            benefit = self.traverseTreeRec(n)*self.domtree[self.superseed_index][n]['weight']
-            rank.append((benefit, n))
-        return rank
+            if first_level_size == 0:
+                return np.zeros(1), np.array([np.random.choice(self.get_remaining_nodes(), replace=False)])
+        first_level = slice(self.tree_level_starts[1], self.tree_level_starts[2])
+        return self.tree_benefit[first_level]*self.tree_weight[first_level], np.asarray(self.tree_nodes[first_level])
 
     def get_best_nodes(self, number_of_nodes):
-        rank = self.get_rank()
-        return [int(a[1]) for a in sorted(rank)[-number_of_nodes:]]
+        benefits, nodes = self.get_rank()
+        # best node first, ties are broken by the larger node
+        order = np.lexsort((nodes, benefits))
+        return [int(node) for node in nodes[order[-number_of_nodes:][::-1]]]
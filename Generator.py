@@ -1,94 +1,241 @@
 import networkx as nx
-from networkx.algorithms import approximation
-import random
 import sys
-import time
 import os
 import argparse
 import numpy as np
 import hashlib
+import json
+import shutil
+import multiprocessing
+import logging
 from scipy.sparse import csr_matrix
+from scipy.sparse.csgraph import connected_components
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from CSRGraph import CSRGraph
+
+_GRAPH_STORE = "graph"
+
+def _generate_graph(task):
+    params, seed_sequence, cache_dir = task
+    G = Generator(params).generate_graph(seed_sequence, cache_dir)
+    # graphs in the cache are loaded by the parent process instead of being sent back
+    return None if cache_dir is not None else G
 
 class Generator:
+    '''
+    Generates directed graphs with random directions and weights. Graphs are produced as edge arrays: binomial, path and grid
+    graphs are generated directly as arrays, other types with NetworkX generators. Directions and weights are drawn with one
+    vectorized draw per graph. Graph i of a run uses the i-th random stream spawned from params["seed"] (or from the global
+    NumPy state if absent), so graphs do not depend on the number of workers and can be cached by their parameters.
+    As with NetworkX graphs built from edges, nodes without edges are not part of the graph.
+    '''
     def __init__(self, params):
         self.params = params
+        self.seed = params["seed"] if "seed" in params else np.random.randint(2**31)
+        self.rng = np.random.default_rng(self.seed)
         self.generators = {
-            'powerlaw_cluster': lambda: nx.powerlaw_cluster_graph(params["n"], params["m"], params["p"]),
-            'grid': lambda: nx.convert_node_labels_to_integers(nx.grid_2d_graph(params['n'], params['n'])),
-            'path': lambda: nx.path_graph(params["n"]),
-            'binomial': lambda: nx.fast_gnp_random_graph(params['n'], params['p']),
-            'watts_strogatz': lambda: nx.watts_strogatz_graph(params['n'], params['k'], params['p']),
-            'karate': lambda: nx.karate_club_graph(),
-            'gaussian_random_partition': lambda: nx.gaussian_random_partition_graph(params['n'], params['s'], params['v'], params['p_in'], params['p_out'])
+            'powerlaw_cluster': lambda seed: nx.powerlaw_cluster_graph(params["n"], params["m"], params["p"], seed=seed),
+            'grid': lambda seed: nx.convert_node_labels_to_integers(nx.grid_2d_graph(params['n'], params['n'])),
+            'path': lambda seed: nx.path_graph(params["n"]),
+            'binomial': lambda seed: nx.fast_gnp_random_graph(params['n'], params['p'], seed=seed),
+            'watts_strogatz': lambda seed: nx.watts_strogatz_graph(params['n'], params['k'], params['p'], seed=seed),
+            'karate': lambda seed: nx.karate_club_graph(),
+            'gaussian_random_partition': lambda seed: nx.gaussian_random_partition_graph(params['n'], params['s'], params['v'], params['p_in'], params['p_out'], seed=seed)
         }
+        self.edge_generators = {
+            'grid': self.get_grid_edges,
+            'path': self.get_path_edges,
+            'binomial': self.get_binomial_edges
+        }
+
+    def gen_graph_id(self, seed_sequence):
+        # content address: the same parameters, seed and graph index give the same graph
+        params = dict(self.params, seed=seed_sequence.entropy, graph_index=list(seed_sequence.spawn_key))
+        return str(self.get_static_hash(json.dumps(params, sort_keys=True, default=str)))
+
+    def generate(self, number_of_graphs=1, workers=1, cache_dir=None):
+        for G in self.generate_csr(number_of_graphs, workers, cache_dir):
+            yield G.to_networkx()
+
+    def generate_csr(self, number_of_graphs=1, workers=1, cache_dir=None):
+        '''
+        Yields graphs in order, generated in a process pool if workers > 1. With a cache directory, graphs are stored there
+        as CSR stores named by graph id and loaded from it if they were generated before.
+        '''
+        if cache_dir is not None and "seed" not in self.params:
+            raise Exception("Graphs can be cached only if params contain a seed")
+        seed_sequences = np.random.SeedSequence(self.seed).spawn(number_of_graphs)
+        if workers <= 1:
+            for seed_sequence in seed_sequences:
+                yield self.generate_graph(seed_sequence, cache_dir)
+            return
+        cached = [cache_dir is not None and CSRGraph.is_store(self.get_cache_path(cache_dir, seed_sequence)) for seed_sequence in seed_sequences]
+        tasks = [(self.params, seed_sequence, cache_dir) for seed_sequence, is_cached in zip(seed_sequences, cached) if not is_cached]
+        with multiprocessing.Pool(workers) as pool:
+            generated = pool.imap(_generate_graph, tasks)
+            for seed_sequence, is_cached in zip(seed_sequences, cached):
+                G = None if is_cached else next(generated)
+                yield G if cache_dir is None else CSRGraph.load(self.get_cache_path(cache_dir, seed_sequence))
+
+    def get_cache_path(self, cache_dir, seed_sequence):
+        return os.path.join(cache_dir, self.gen_graph_id(seed_sequence))
+
+    def generate_graph(self, seed_sequence, cache_dir=None):
+        if cache_dir is not None:
+            path = self.get_cache_path(cache_dir, seed_sequence)
+            if CSRGraph.is_store(path):
+                return CSRGraph.load(path)
+        self.rng = np.random.default_rng(seed_sequence)
+        sources, targets, directed = self.get_edges()
+        if not directed:
+            sources, targets = Generator.get_random_directions(sources, targets, self.params["both_directions"], self.rng)
+        elif self.params["both_directions"]:
+            raise Exception("Not implemeted")
+        weights = Generator.get_weights(len(sources), self.params["weight_scale"], self.params["random_weight"], self.rng)
+        graph = {'graph_id': self.gen_graph_id(seed_sequence), 'graph_index': seed_sequence.spawn_key[-1]}
+        graph.update(self.params)
+        graph['seed'] = self.seed
+        G = CSRGraph.from_edges(sources, targets, weights, graph=graph)
+        if cache_dir is not None:
+            # written under a temporary name and renamed, so an interrupted run never leaves a partial graph
+            tmp_path = path + ".tmp" + str(os.getpid())
+            G.save(tmp_path)
+            try:
+                os.rename(tmp_path, path)
+            except OSError:
+                shutil.rmtree(tmp_path)  # generated by another process in the meantime
+            return CSRGraph.load(path)
+        return G
+
+    def get_edges(self):
+        '''
+        Edges of one graph as arrays of sources and targets, and whether the edges are directed
+        '''
+        graph_type = self.params["graph_type"]
+        if graph_type in self.edge_generators:
+            sources, targets = self.edge_generators[graph_type]()
+            return sources, targets, False
+        G = self.generators[graph_type](int(self.rng.integers(2**32)))
+        edges = np.array(list(G.edges()), dtype=np.int64).reshape((-1, 2))
+        return edges[:, 0], edges[:, 1], nx.is_directed(G)
+
+    def get_path_edges(self):
+        sources = np.arange(self.params["n"] - 1, dtype=np.int64)
+        return sources, sources + 1
+
+    def get_grid_edges(self):
+        # node (i, j) of the n x n grid is i*n + j, as in nx.convert_node_labels_to_integers(nx.grid_2d_graph(n, n))
+        n = self.params["n"]
+        nodes = np.arange(n*n, dtype=np.int64).reshape((n, n))
+        sources = np.concatenate([nodes[:-1, :].ravel(), nodes[:, :-1].ravel()])
+        targets = np.concatenate([nodes[1:, :].ravel(), nodes[:, 1:].ravel()])
+        return sources, targets
+
+    def get_binomial_edges(self):
+        '''
+        G(n, p): the number of edges is drawn from the binomial distribution, then as many distinct node pairs
+        uniformly among the n(n-1)/2 pairs, numbered row by row in the upper triangle of the adjacency matrix
+        '''
+        n, p = self.params["n"], self.params["p"]
+        pairs = n*(n - 1)//2
+        number_of_edges = self.rng.binomial(pairs, p)
+        index = np.sort(self.rng.choice(pairs, number_of_edges, replace=False)).astype(np.int64)
+        row_start = lambda i: i*(2*n - i - 1)//2
+        sources = np.floor((2*n - 1 - np.sqrt((2*n - 1)**2 - 8.*index))/2).astype(np.int64)
+        sources[row_start(sources) > index] -= 1
+        sources[row_start(sources + 1) <= index] += 1
+        targets = index - row_start(sources) + sources + 1
+        return sources, targets
 
-    def gen_graph_id(self):
-        return str(self.get_static_hash(str(int(time.time())) + str(random.randint(10000, 99999)) + "_".join([str(self.params[p]) for p in self.params])))
-
-    def generate(self, number_of_graphs=1):
-        for i in range(number_of_graphs):
-            G = self.generators[self.params["graph_type"]]()
-            if self.params["graph_type"] != 'vk':
-                if self.params["graph_type"] not in ["gnutella", "stanford"]:
-                    G = self.add_random_directions(G, self.params["both_directions"])
-                else:
-                    if self.params["both_directions"]:
-                        raise Exception("Not implemeted")
-                G = self.assign_weights(G, self.params["weight_scale"], self.params["random_weight"])
-            G.graph['graph_id'] = self.gen_graph_id()
-            G.graph.update(self.params)
-            yield G
+    @staticmethod
+    def get_random_directions(sources, targets, both, rng):
+        if both:
+            return np.concatenate([sources, targets]), np.concatenate([targets, sources])
+        flip = rng.random(len(sources)) < 0.5
+        return np.where(flip, targets, sources), np.where(flip, sources, targets)
+
+    @staticmethod
+    def get_weights(number_of_edges, weight_scale, random_weight, rng):
+        if random_weight:
+            return rng.random(number_of_edges)*weight_scale
+        return np.full(number_of_edges, float(weight_scale))
 
     @staticmethod # used in tests
     def assign_weights(G, weight_scale, random_weight):
-        if random_weight:
-            for e in G.edges():
-                a = np.random.random()*weight_scale
-                G[e[0]][e[1]]['weight'] = np.random.random()*weight_scale
-        else:
-            for e in G.edges():
-                G[e[0]][e[1]]['weight'] = weight_scale
+        weights = Generator.get_weights(G.number_of_edges(), weight_scale, random_weight, np.random)
+        nx.set_edge_attributes(G, dict(zip(G.edges(), weights.tolist())), 'weight')
         return G
 
     @staticmethod
     def add_random_directions(G, both=False):
         assert(not nx.is_directed(G))
+        edges = list(G.edges(data=True))
+        flip = np.random.random(len(edges)) < 0.5
         dG = nx.DiGraph()
-        for e in G.edges():
-            if both:
-                dG.add_edge(e[0],e[1])
-                dG.add_edge(e[1],e[0])
-                for key in G[e[0]][e[1]]:
-                    dG[e[0]][e[1]][key] = G[e[0]][e[1]][key]
-                    dG[e[1]][e[0]][key] = G[e[0]][e[1]][key]
-            else:
-                if np.random.random() < 0.5:
-                    dG.add_edge(e[0],e[1])
-                    for key in G[e[0]][e[1]]:
-                        dG[e[0]][e[1]][key] = G[e[0]][e[1]][key]
-                else:
-                    dG.add_edge(e[1],e[0])
-                    for key in G[e[1]][e[0]]:
-                        dG[e[1]][e[0]][key] = G[e[0]][e[1]][key]
+        if both:
+            dG.add_edges_from([(u, v, dict(d)) for u, v, d in edges] + [(v, u, dict(d)) for u, v, d in edges])
+        else:
+            dG.add_edges_from([(v, u, dict(d)) if f else (u, v, dict(d)) for (u, v, d), f in zip(edges, flip.tolist())])
         return dG
 
     @staticmethod
-    def analyze_graph(G):
-        G.graph['directed'] = nx.is_directed(G)
-        G_und = G.to_undirected()
-        G.graph['connected_components'] = nx.number_connected_components(G_und)
-        G.graph['largest_component'] = len(max(nx.connected_components(G_und), key=len))
-
-        logging.info("Graph ID {}: components analyzed.".format(G.graph['graph_id']))
-        G.graph['average_clustering'] = approximation.average_clustering(G_und)
-        logging.info("Graph ID {}: clustering analyzed.".format(G.graph['graph_id']))
-        degrees = [d for n, d in G.degree()]
-        G.graph['min_degree'] = min(degrees),max(degrees),np.mean(degrees),np.median(degrees)
-        G.graph['max_degree'] = max(degrees)
-        G.graph['avg_degree'] = np.mean(degrees)
-        G.graph['std_degree'] = np.std(degrees)
-        G.graph['median_degree'] = np.median(degrees)
-        logging.info("Graph ID {}: degrees analyzed.".format(G.graph['graph_id']))
+    def analyze_graph(G, clustering_samples=1000, seed=None):
+        G.graph.update(Generator.get_graph_stats(G, clustering_samples, seed))
+
+    @staticmethod
+    def get_graph_stats(G, clustering_samples=1000, seed=None):
+        '''
+        Statistics of a NetworkX graph or a CSRGraph computed from one sparse undirected adjacency matrix.
+        Degrees are the degrees in G (in-degree plus out-degree for directed graphs), components and clustering
+        are computed on the undirected graph, clustering is estimated from clustering_samples random nodes
+        as in networkx.algorithms.approximation.average_clustering.
+        '''
+        stats = {}
+        directed = isinstance(G, CSRGraph) or nx.is_directed(G)
+        csr = G if isinstance(G, CSRGraph) else CSRGraph.from_networkx(G)
+        stats['directed'] = directed
+        sources = csr.get_sources()
+        loops = sources == csr.indices
+        A = csr_matrix((np.ones(len(sources) - loops.sum(), dtype=np.int8), (sources[~loops], csr.indices[~loops])),
+                       shape=(len(csr), len(csr)))
+        U = ((A + A.T) > 0).astype(np.int8)
+        U.sort_indices()
+
+        number_of_components, labels = connected_components(U, directed=False)
+        stats['connected_components'] = number_of_components
+        stats['largest_component'] = int(np.bincount(labels).max())
+        logging.info("Graph ID {}: components analyzed.".format(csr.graph.get('graph_id')))
+        stats['average_clustering'] = Generator.get_sampled_clustering(U, clustering_samples, np.random.default_rng(seed))
+        logging.info("Graph ID {}: clustering analyzed.".format(csr.graph.get('graph_id')))
+
+        degrees = csr.get_degrees() if directed else np.diff(csr.indptr)
+        stats['min_degree'] = int(degrees.min())
+        stats['max_degree'] = int(degrees.max())
+        stats['avg_degree'] = float(np.mean(degrees))
+        stats['std_degree'] = float(np.std(degrees))
+        stats['median_degree'] = float(np.median(degrees))
+        logging.info("Graph ID {}: degrees analyzed.".format(csr.graph.get('graph_id')))
+        return stats
+
+    @staticmethod
+    def get_sampled_clustering(U, samples, rng):
+        '''
+        Fraction of sampled nodes for which two random distinct neighbors are connected, nodes with less than two
+        neighbors count as no triangle. U is a symmetric adjacency matrix with sorted indices.
+        '''
+        n = U.shape[0]
+        degrees = np.diff(U.indptr)
+        nodes = rng.integers(n, size=samples)
+        nodes = nodes[degrees[nodes] >= 2]
+        first = rng.integers(degrees[nodes])
+        second = rng.integers(degrees[nodes] - 1)
+        second += second >= first
+        u = U.indices[U.indptr[nodes] + first].astype(np.int64)
+        v = U.indices[U.indptr[nodes] + second].astype(np.int64)
+        edge_keys = np.repeat(np.arange(n, dtype=np.int64), degrees)*n + U.indices
+        keys = u*n + v
+        found = np.minimum(np.searchsorted(edge_keys, keys), len(edge_keys) - 1)
+        return float(np.sum(edge_keys[found] == keys))/samples
 
     @staticmethod
     def get_static_hash(string):
@@ -104,23 +251,36 @@ if __name__ == "__main__":
     parser.add_argument("-b", "--both_directions", type=int, default=1)
     parser.add_argument("-w", "--weight_scale", type=float, default=0.3)
     parser.add_argument("-p", "--other_params", type=str, nargs="*")
+    parser.add_argument("-f", "--format", type=str, default="pickle", choices=["pickle", "csr", "edgelist"])
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--cache_dir", type=str, default=None, help="reuse graphs generated before with the same parameters and seed")
 
     args = parser.parse_args()
     other_params = {"graph_type": args.graph_type,
                     "both_directions": args.both_directions,
                     "weight_scale": args.weight_scale,
                     "random_weight": 1}
+    if args.seed is not None:
+        other_params["seed"] = args.seed
     if args.other_params:
         for i in range(int(len(args.other_params)/2)):
-            if args.other_params[2*i+1].isdigit():
-                other_params[args.other_params[2*i]] = int(args.other_params[2*i+1])
-            else:
-                other_params[args.other_params[2*i]] = args.other_params[2*i+1]
+            value = args.other_params[2*i+1]
+            for parse in [int, float, str]:
+                try:
+                    other_params[args.other_params[2*i]] = parse(value)
+                    break
+                except ValueError:
+                    continue
     z = dict(other_params)
     gen = Generator(z)
-    G = next(gen.generate())
-    nx.write_gpickle(G, args.graph_outfile)
+    G = next(gen.generate_csr(cache_dir=args.cache_dir))
+    if args.format == "csr":
+        G.save(args.graph_outfile)
+    elif args.format == "edgelist":
+        G.save_edgelist(args.graph_outfile)
+    else:
+        nx.write_gpickle(G.to_networkx(), args.graph_outfile)
     n = args.number_of_seeds
-    seeds = np.random.choice([node for node in G.nodes()], n, replace=False)
+    seeds = np.random.default_rng(gen.seed).choice(G.node_ids, n, replace=False)
     np.savetxt(args.seed_outfile, seeds, fmt="%1u")
     print("Done.")
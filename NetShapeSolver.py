@@ -1,6 +1,8 @@
 import networkx as nx
 import numpy as np
 from scipy.linalg import eigh
+from scipy.sparse import csr_matrix, diags
+from scipy.sparse.linalg import eigsh, LinearOperator
 import time
 import sys
 import os
@@ -10,6 +12,16 @@ from Solver import *
 
 
 class NetShapeSolver(Solver):
+    '''
+    Parameters:
+    epsilon: accuracy of the subgradient method, defines the number of iterations T
+    eigensolver: "sparse" (default) keeps F and Delta sparse and computes the leading eigenvector iteratively,
+                 warm-started from the previous iteration, "dense" uses dense N x N matrices
+    tolerance: stop before T iterations once the relative change of the averaged x is below tolerance
+               for 'patience' (default 10) consecutive iterations, 0 (default) always runs T iterations
+    '''
+    supports_csr = True
+
     def clear(self):
         np.warnings.filterwarnings('ignore')
         self.epsilon = self.params['epsilon']
@@ -38,12 +50,50 @@ class NetShapeSolver(Solver):
             delta[node_index, :] = 0
         return delta
 
+    def init_sparse_variables(self):
+        csr = self.get_csr()
+        self.nodelist = csr.node_ids.tolist()
+        self.inverse_nodelist = csr.node_index
+        self.F = csr_matrix((csr.weights, csr.indices, csr.indptr), shape=(len(csr), len(csr)))
+        not_seed = np.ones(len(csr))
+        not_seed[csr.to_index(self.seeds)] = 0
+        self.Delta = (diags(not_seed) @ -self.F).tocsr()
+        self.FT = self.F.transpose().tocsr()
+        self.DeltaT = self.Delta.transpose().tocsr()
+        self.delta_prime = np.sqrt(np.ravel(self.Delta.multiply(self.Delta).sum(axis=1)))
+        self.R = np.sqrt(self.k)*(np.max(np.abs(self.Delta.data)) if self.Delta.nnz > 0 else 0)
+        self.T = int(math.ceil((self.R/self.epsilon)**2))
+
+        self.x = np.zeros(len(csr))
+        self.x_star = self.x.copy()
+        self.u = np.ones(len(csr))
+
     def calculate_x_star(self):
-        self.init_variables()
+        if self.params.get("eigensolver", "sparse") == "dense":
+            self.G = self.get_networkx()
+            self.init_variables()
+            perform_iteration = self.perform_iteration
+        else:
+            self.init_sparse_variables()
+            perform_iteration = self.perform_sparse_iteration
+        tolerance = self.params.get("tolerance", 0)
+        self.stable_iterations = 0
+        iterations = 0
         for iteration in range(1,self.T+1):
-            self.perform_iteration(iteration)
+            x_average = self.x_star/max(iteration-1, 1)
+            perform_iteration(iteration)
+            iterations += 1
+            if tolerance > 0 and self.is_converged(x_average, self.x_star/iteration, tolerance):
+                break
+        self.log['Iterations'] = iterations
+        self.log['Max iterations'] = self.T
         return self.x_star
 
+    def is_converged(self, previous_average, average, tolerance):
+        change = np.sum(np.abs(average - previous_average))/max(np.sum(np.abs(average)), 1e-12)
+        self.stable_iterations = self.stable_iterations + 1 if change < tolerance else 0
+        return self.stable_iterations >= self.params.get("patience", 10)
+
     def get_hazard_result(self):
         return np.multiply((1-(1/self.T)*self.get_x_matrix(self.x_star)), self.F), self.x_star
 
@@ -62,6 +112,31 @@ class NetShapeSolver(Solver):
         self.x_star += np.real(self.x)
         return max_eig
 
+    def perform_sparse_iteration(self, iteration):
+        '''
+        Same step as perform_iteration, with diag(x) applied as a row scaling of Delta and the rank-one
+        subgradient u*u^T folded into the projection input: sum_j (x_i*Delta_ij - c*u_i*u_j)*Delta_ij
+        = x_i*delta_prime_i^2 - c*u_i*(Delta*u)_i
+        '''
+        x = self.x
+        N = len(x)
+        M2 = LinearOperator((N, N), dtype=np.float64,
+                            matvec=lambda v: 0.5*(self.F @ np.ravel(v) + x*(self.Delta @ np.ravel(v)) + self.FT @ np.ravel(v) + self.DeltaT @ (x*np.ravel(v))))
+        if N < 3:
+            W, V = eigh(M2.matmat(np.eye(N)))
+            max_eig, u = W[-1], V[:, -1]
+        else:
+            W, V = eigsh(M2, k=1, which='LA', v0=self.u)
+            max_eig, u = W[0], V[:, 0]
+        self.u = u
+
+        dp = self.delta_prime.copy()
+        dp[dp == 0] = 1
+        y_prime = (x*self.delta_prime**2 - self.R/np.sqrt(iteration)*u*(self.Delta @ u))/dp
+        self.x = self.get_projection_from_primes(self.delta_prime, y_prime)
+        self.x_star += self.x
+        return max_eig
+
     @staticmethod
     def get_x_matrix(x):
         x = np.reshape(x, (len(x), 1)).copy()
@@ -70,7 +145,9 @@ class NetShapeSolver(Solver):
     def get_projection(self, delta, y):
         delta_prime = self.get_delta_prime(delta)
         y_prime = self.get_y_prime(y, delta, delta_prime)
+        return self.get_projection_from_primes(delta_prime, y_prime)
 
+    def get_projection_from_primes(self, delta_prime, y_prime):
         N = len(self.G)
         mu1 = 2*np.multiply(y_prime, delta_prime)
         mu2 = mu1-2*delta_prime**2
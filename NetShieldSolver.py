@@ -4,6 +4,8 @@ import time
 import sys
 import itertools
 from scipy.linalg import eigh
+from scipy.sparse import csr_matrix
+from scipy.sparse.linalg import eigsh
 import os
 from heapq import *
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
@@ -56,39 +58,101 @@ class PriorityQueue:
         raise KeyError('pop from an empty priority queue')
 
 class NetShieldSolver(Solver):
+    '''
+    Parameters:
+    eigensolver: "sparse" (default) computes the leading eigenpair of a sparse adjacency with ARPACK,
+                 "dense" uses a dense adjacency matrix and scipy.linalg.eigh
+    tolerance: relative accuracy of the sparse eigensolver, 0 for machine precision
+    batch_size: nodes selected from one eigenpair (default k). After every batch the selected nodes are removed and the
+                leading eigenpair of the remaining adjacency is recomputed with the sparse eigensolver,
+                started from the previous eigenvector. Smaller batches are slower and closer to full greedy recomputation.
+    '''
+    supports_csr = True
+    prefix_solutions = True
 
     def net_shield(self):
-        G = self.G.to_undirected()
-        nodelist = [n for n in G.nodes()]
-        inverse_index = {}
-        for i in range(len(nodelist)):
-            inverse_index[nodelist[i]] = i
-
         t1 = time.time()
-        A = nx.to_numpy_matrix(G, nodelist=nodelist, weight=None)
-        M = len(G)
-        W, V = eigh(A, eigvals=(M-1, M-1), type=1, overwrite_a=True)
-        max_eig = W[0]
-        max_eigvec = V[:,0].reshape((V.shape[0],))
+        A, nodelist, max_eig, max_eigvec = self.get_cached("eigenpair", self.get_adjacency_eigenpair)
+        A = csr_matrix(A)
 
         self.log["Eigenvalue"] = max_eig
+        batch_size = self.params.get("batch_size", self.k)
+        if batch_size <= 0:
+            raise Exception("batch_size should be greater than 0")
+
+        # indices of the remaining nodes of the reduced adjacency in nodelist
+        remaining = np.arange(A.shape[0])
+        selection_order = []
+        eigenvalues = [max_eig]
+        while True:
+            batch = self.select_nodes(A, max_eig, max_eigvec, min(batch_size, self.k - len(selection_order)))
+            selection_order += remaining[batch].tolist()
+            if len(selection_order) >= self.k:
+                break
+            keep = np.ones(len(remaining), dtype=bool)
+            keep[batch] = False
+            remaining = remaining[keep]
+            A = A[keep][:, keep]
+            v0 = max_eigvec[keep]
+            max_eig, max_eigvec = self.get_top_eigenpair(A, v0 if np.any(v0) else None)
+            eigenvalues.append(max_eig)
+        if len(eigenvalues) > 1:
+            self.log["Eigenvalues"] = eigenvalues
+
+        t2 = time.time()
+        self.log['Total time'] = t2-t1
 
+        return [nodelist[i] for i in selection_order]
+
+    def select_nodes(self, neighbors, max_eig, max_eigvec, k):
+        '''
+        Greedy selection of k node indices by their shield value on one eigenpair
+        '''
         scores = 2*max_eig*(max_eigvec**2)
-        pk = PriorityQueue(zip(scores.tolist(), list(range(len(G)))))
+        pk = PriorityQueue(zip(scores.tolist(), list(range(len(max_eigvec)))))
 
         S = set()
-        for it in range(self.k):
+        selection_order = []
+        for it in range(k):
             next_best = pk.pop_task()
             S.add(next_best)
-            for n in G.neighbors(nodelist[next_best]):
-                j = inverse_index[n]
+            selection_order.append(next_best)
+            for j in neighbors.indices[neighbors.indptr[next_best]:neighbors.indptr[next_best+1]]:
                 if j not in S:
                     pk.update_task_add(j, -2 * max_eigvec[next_best] * max_eigvec[j])
+        return np.array(selection_order, dtype=np.int64)
 
-        t2 = time.time()
-        self.log['Total time'] = t2-t1
+    def get_adjacency_eigenpair(self):
+        if self.params.get("eigensolver", "sparse") == "dense":
+            G = self.get_networkx().to_undirected(as_view=True)
+            nodelist = [n for n in G.nodes()]
+            A = nx.to_numpy_matrix(G, nodelist=nodelist, weight=None)
+            M = len(G)
+            W, V = eigh(A, eigvals=(M-1, M-1), type=1, overwrite_a=True)
+            max_eig = W[0]
+            max_eigvec = V[:,0].reshape((V.shape[0],))
+        else:
+            A, nodelist = self.get_sparse_adjacency()
+            max_eig, max_eigvec = self.get_top_eigenpair(A)
+        return A, nodelist, max_eig, max_eigvec
+
+    def get_sparse_adjacency(self):
+        # symmetric unweighted adjacency, memory is linear in the number of edges
+        csr = self.get_csr()
+        A = csr_matrix((np.ones(csr.number_of_edges()), csr.indices, csr.indptr), shape=(len(csr), len(csr)))
+        A = ((A + A.T) > 0).astype(np.float64)
+        return A, csr.node_ids.tolist()
 
-        return [nodelist[i] for i in S]
+    def get_top_eigenpair(self, A, v0=None):
+        if A.shape[0] < 3:
+            W, V = eigh(A.toarray())
+            return W[-1], V[:,-1]
+        if A.nnz == 0:
+            return 0., np.ones(A.shape[0])/np.sqrt(A.shape[0])
+        if v0 is None:
+            v0 = np.ones(A.shape[0])
+        W, V = eigsh(A, k=1, which='LA', v0=v0, tol=self.params.get("tolerance", 0))
+        return W[0], V[:,0]
 
     def run(self):
         blocked = self.net_shield()
@@ -0,0 +1,121 @@
+'''
+Reverse reachable (RR) sampling of live-edge worlds for seed-aware immunization.
+A sample draws a target node uniformly among non-seed nodes and explores a live-edge world backwards from it
+until the seeds. Blocking any cut between the seeds and the target in the sample saves the target in that world.
+'''
+
+import os
+import sys
+import math
+import numpy as np
+import networkx as nx
+from collections import defaultdict
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from CSRGraph import CSRGraph
+
+class RRSampler:
+
+    def __init__(self, G, seeds, seed=None):
+        self.csr = G if isinstance(G, CSRGraph) else CSRGraph.from_networkx(G)
+        self.reverse = self.csr.reverse()
+        self.seed_indices = np.unique(self.csr.to_index(seeds))
+        self.is_seed = np.zeros(len(self.csr), dtype=bool)
+        self.is_seed[self.seed_indices] = True
+        self.candidates = np.nonzero(~self.is_seed)[0]
+        self.rng = np.random.default_rng(seed)
+        self.visited = np.zeros(len(self.csr), dtype=bool)
+
+        # samples are stored in concatenated arrays, live edges of sample i are edge_ptr[i]:edge_ptr[i+1]
+        self.targets = np.zeros(0, dtype=np.int64)
+        self.reaches_seeds = np.zeros(0, dtype=bool)
+        self.edge_sources = np.zeros(0, dtype=np.int64)
+        self.edge_targets = np.zeros(0, dtype=np.int64)
+        self.edge_ptr = np.zeros(1, dtype=np.int64)
+
+    @staticmethod
+    def get_sample_size(epsilon, delta):
+        # Hoeffding bound: the fraction of samples saved by a fixed blocked set is
+        # within epsilon of its expectation with probability at least 1 - delta
+        return int(math.ceil(math.log(2/delta)/(2*epsilon**2)))
+
+    def __len__(self):
+        return len(self.targets)
+
+    def sample(self, number_of_samples):
+        targets = self.candidates[self.rng.integers(len(self.candidates), size=number_of_samples)]
+        reaches_seeds = np.zeros(number_of_samples, dtype=bool)
+        sources, edge_targets, counts = [], [], []
+        for i, target in enumerate(targets):
+            u, v, reaches_seeds[i] = self.sample_live_edges(target)
+            sources.append(u)
+            edge_targets.append(v)
+            counts.append(len(u))
+        self.targets = np.concatenate([self.targets, targets])
+        self.reaches_seeds = np.concatenate([self.reaches_seeds, reaches_seeds])
+        self.edge_sources = np.concatenate([self.edge_sources] + sources)
+        self.edge_targets = np.concatenate([self.edge_targets] + edge_targets)
+        self.edge_ptr = np.concatenate([self.edge_ptr, self.edge_ptr[-1] + np.cumsum(counts, dtype=np.int64)])
+
+    def sample_live_edges(self, target):
+        '''
+        Explores the live-edge world backwards from the target, one random draw per block of frontier in-edges.
+        Seeds are not expanded further. Returns live edges (u, v) in forward direction and whether a seed was reached.
+        '''
+        rev = self.reverse
+        front = np.array([target], dtype=np.int64)
+        self.visited[target] = True
+        visited = [front]
+        sources, targets = [], []
+        while len(front) > 0:
+            edges = rev.get_out_edges(front)
+            edges = edges[self.rng.random(len(edges)) <= rev.weights[edges]]
+            sources.append(rev.indices[edges])
+            targets.append(rev.get_sources()[edges])
+            new = np.unique(rev.indices[edges])
+            new = new[~self.visited[new]]
+            self.visited[new] = True
+            visited.append(new)
+            front = new[~self.is_seed[new]]
+        visited = np.concatenate(visited)
+        self.visited[visited] = False
+        return np.concatenate(sources), np.concatenate(targets), bool(self.is_seed[visited].any())
+
+    def get_sample_edges(self, i):
+        return self.edge_sources[self.edge_ptr[i]:self.edge_ptr[i+1]], self.edge_targets[self.edge_ptr[i]:self.edge_ptr[i+1]]
+
+    def get_sample_cuts(self, i, max_cut_size=1):
+        '''
+        Returns node cuts between the seeds and the target of sample i: every dominator of the target
+        (the target included), and a minimum node cut if it has 2 to max_cut_size nodes
+        '''
+        if not self.reaches_seeds[i]:
+            return []
+        root = -1
+        target = self.targets[i]
+        H = nx.DiGraph()
+        u, v = self.get_sample_edges(i)
+        H.add_edges_from(zip(np.where(self.is_seed[u], root, u).tolist(), v.tolist()))
+        idom = nx.immediate_dominators(H, root)
+        cuts = []
+        n = target
+        while n != root:
+            cuts.append((self.csr.node_ids[n].item(),))
+            n = idom[n]
+        if max_cut_size > 1 and len(cuts) == 1 and not H.has_edge(root, target):
+            cut = nx.minimum_node_cut(H, root, target)
+            if len(cut) <= max_cut_size:
+                cuts.append(tuple(sorted(self.csr.node_ids[list(cut)].tolist())))
+        return cuts
+
+    def get_ranking(self, max_cut_size=1):
+        '''
+        Ranking in the format of SetSelector: cut -> list of sample ids saved by blocking the cut
+        '''
+        ranking = defaultdict(lambda: [])
+        for i in range(len(self)):
+            for cut in self.get_sample_cuts(i, max_cut_size):
+                ranking[cut].append(i)
+        return dict(ranking)
+
+    def get_sample_to_node_index(self):
+        return self.csr.node_ids[self.targets].tolist()
@@ -0,0 +1,55 @@
+'''
+The class selects blocked nodes by greedy cut selection over reverse reachable live-edge samples.
+
+Parameters:
+epsilon, delta: the number of samples guarantees that the saved fraction of any fixed blocked set
+                is estimated within epsilon with probability at least 1 - delta (default 0.02, 0.05)
+max_samples: upper bound on the number of samples
+max_cut_size: largest multi-node cut registered per sample, 1 (default) uses only dominators
+strategy: SetSelector strategy, "lazy" (default) or "basic"
+seed: seed of the random generator
+'''
+
+import os
+import sys
+import time
+from collections import defaultdict
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from Solver import *
+from RRSampler import RRSampler
+from SetSelector import SetSelector
+
+class RRSolver(Solver):
+    supports_csr = True
+
+    def clear(self):
+        # greedy selection of single-node cuts does not depend on k, larger cuts are limited by the remaining budget
+        self.prefix_solutions = self.params.get("max_cut_size", 1) == 1
+
+    def run(self):
+        t1 = time.time()
+        sampler, ranking = self.get_cached("samples", self.get_samples)
+        number_of_samples = len(sampler)
+
+        selector = SetSelector(ranking)
+        selector.set_sample_to_node_index(sampler.get_sample_to_node_index())
+        selector.set_sampled_nodes_weights(defaultdict(lambda: 1))
+        selector.get_best_nodes(self.k, self.params.get("strategy", "lazy"))
+        blocked = list(selector.selection_order)
+        if len(blocked) < self.k:
+            self.log['error'] = "Problem is trivial"
+            candidates = [n for n in sampler.csr.to_nodes(sampler.candidates).tolist() if n not in blocked]
+            blocked += list(sampler.rng.choice(candidates, self.k - len(blocked), replace=False))
+        t2 = time.time()
+
+        self.log.update(selector.log)
+        self.log['Samples'] = number_of_samples
+        self.log['Estimated saved nodes'] = len(sampler.candidates)*len(selector.get_positive_samples(blocked))/number_of_samples
+        self.log['Total time'] = t2 - t1
+        self.log['Blocked nodes'] = [int(node) for node in blocked]
+
+    def get_samples(self):
+        sampler = RRSampler(self.G, self.seeds, self.params.get("seed", None))
+        number_of_samples = RRSampler.get_sample_size(self.params.get("epsilon", 0.02), self.params.get("delta", 0.05))
+        sampler.sample(min(number_of_samples, self.params.get("max_samples", number_of_samples)))
+        return sampler, sampler.get_ranking(self.params.get("max_cut_size", 1))
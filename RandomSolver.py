@@ -4,6 +4,8 @@ import numpy as np
 from Solver import *
 
 class RandomSolver(Solver):
+    supports_csr = True
+    prefix_solutions = True
 
     def run(self):
         t1 = time.time()
@@ -0,0 +1,121 @@
+'''
+Streaming mean and variance (Welford) of scalar or NumPy array values, with an optional histogram of non-negative
+integer values for percentiles. Accumulators of disjoint streams are merged exactly, e.g. results of parallel workers.
+The histogram counts values below 2^HISTOGRAM_BITS exactly and larger values in logarithmic buckets of relative width
+at most 2^(1-HISTOGRAM_BITS), so its size grows only with the logarithm of the largest value.
+With covariance, values are vectors (in the last axis) and the covariance matrix of their elements is kept instead of
+the variance, which gives control variate estimates of the mean of the first element.
+'''
+
+import math
+import numpy as np
+
+class RunningStats:
+
+    HISTOGRAM_BITS = 8
+
+    def __init__(self, histogram=False, covariance=False):
+        self.n = 0
+        self.mean = 0.
+        self.m2 = 0.
+        self.covariance = covariance
+        self.use_histogram = histogram
+        self.histogram = None  # counts[i, b] of values in bucket b at position i, a scalar has one position
+
+    def add(self, x):
+        x = np.asarray(x, dtype=np.float64) if isinstance(x, (list, np.ndarray)) else float(x)
+        self.n += 1
+        delta = x - self.mean
+        self.mean = self.mean + delta/self.n
+        if self.covariance:
+            self.m2 = self.m2 + delta[..., :, None]*(x - self.mean)[..., None, :]
+        else:
+            self.m2 = self.m2 + delta*(x - self.mean)
+        if self.use_histogram:
+            self.add_to_histogram(x)
+
+    def add_to_histogram(self, x):
+        buckets = RunningStats.get_bucket(np.atleast_1d(np.asarray(x)).astype(np.int64))
+        self.grow_histogram(len(buckets), buckets.max() + 1)
+        self.histogram[np.arange(len(buckets)), buckets] += 1
+
+    @staticmethod
+    def get_bucket(values):
+        # the lowest `shift` bits are dropped from values with more than HISTOGRAM_BITS bits
+        half = 2**(RunningStats.HISTOGRAM_BITS - 1)
+        shift = np.maximum(np.frexp(values)[1] - RunningStats.HISTOGRAM_BITS, 0)
+        return shift*half + (values >> shift)
+
+    @staticmethod
+    def get_bucket_start(buckets):
+        half = 2**(RunningStats.HISTOGRAM_BITS - 1)
+        shift = np.maximum(buckets//half - 1, 0)
+        return (buckets - shift*half) << shift
+
+    def grow_histogram(self, positions, size):
+        if self.histogram is None:
+            self.histogram = np.zeros((positions, size), dtype=np.int64)
+        elif self.histogram.shape[1] < size:
+            self.histogram = np.pad(self.histogram, ((0, 0), (0, size - self.histogram.shape[1])))
+
+    def merge(self, other):
+        '''
+        Adds the values of the other accumulator (Chan et al. pairwise update)
+        '''
+        if other.n == 0:
+            return self
+        n = self.n + other.n
+        delta = other.mean - self.mean
+        self.mean = self.mean + delta*other.n/n
+        if self.covariance:
+            self.m2 = self.m2 + other.m2 + delta[..., :, None]*delta[..., None, :]*self.n*other.n/n
+        else:
+            self.m2 = self.m2 + other.m2 + delta**2*self.n*other.n/n
+        self.n = n
+        if other.histogram is not None:
+            self.grow_histogram(*other.histogram.shape)
+            self.histogram[:, :other.histogram.shape[1]] += other.histogram
+        return self
+
+    def get_var(self):
+        if self.n < 2:
+            return self.mean*np.nan
+        return self.m2/(self.n - 1)
+
+    def get_control_variate_stats(self, control_means):
+        '''
+        Estimate of the mean of the first element corrected by the other elements (controls) with known means,
+        with the regression coefficients estimated from the same values.
+        var is the residual variance of one value, comparable to the variance of the first element ('plain var').
+        '''
+        controls = self.mean.shape[-1] - 1
+        if self.n <= controls + 1:
+            return {'mean': self.mean[..., 0], 'var': self.mean[..., 0]*np.nan, 'plain var': self.mean[..., 0]*np.nan}
+        cov = self.get_var()
+        cov_xy = cov[..., 1:, 0]
+        beta = np.einsum('...ij,...j->...i', np.linalg.pinv(cov[..., 1:, 1:]), cov_xy)
+        mean = self.mean[..., 0] - np.einsum('...i,...i->...', beta, self.mean[..., 1:] - control_means)
+        var = np.maximum(cov[..., 0, 0] - np.einsum('...i,...i->...', beta, cov_xy), 0.)*(self.n - 1)/(self.n - 1 - controls)
+        return {'mean': mean, 'var': var, 'plain var': cov[..., 0, 0]}
+
+    def get_confidence_interval(self, z):
+        # half-width of the normal confidence interval of the mean
+        return z*np.sqrt(self.get_var())/math.sqrt(self.n)
+
+    def get_percentile(self, q):
+        '''
+        The smallest value with at least q percent of the values not greater than it,
+        for values in a logarithmic bucket the smallest value of the bucket
+        '''
+        cumulative = np.cumsum(self.histogram, axis=1)
+        values = RunningStats.get_bucket_start((cumulative < max(q/100.*self.n, 1)).sum(axis=1))
+        return values[0].item() if np.ndim(self.mean) == 0 else values
+
+    def get_stats(self, percentiles=()):
+        s = {}
+        s['mean'] = self.mean
+        s['var'] = self.get_var()
+        if self.histogram is not None:
+            for q in percentiles:
+                s['p%g' % q] = self.get_percentile(q)
+        return s
@@ -4,6 +4,7 @@ sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 import helpers
 import time
 import logging
+import heapq
 from collections import defaultdict, Counter
 
 class SetSelector():
@@ -65,7 +66,10 @@ class SetSelector():
         return scores
 
     def get_best_nodes(self, k, strategy="basic"):
+        if strategy == "lazy":
+            return self.get_best_nodes_lazy(k)
         selected_nodes = set()
+        self.selection_order = []
         ranking = dict(self.ranking)
         it = 0
         while len(selected_nodes) < k:
@@ -80,11 +84,121 @@ class SetSelector():
             if new_nodes == None:
                 break
             for n in new_nodes:
+                if n not in selected_nodes:
+                    self.selection_order.append(n)
                 selected_nodes.add(n)
         self.log["Scores are weighted"] = self.is_weighted
         self.log["Blocking nodes selection iterations"] = it
         return selected_nodes
 
+    def get_best_nodes_lazy(self, k):
+        '''
+        Same selection as the basic strategy, with node -> cuts and sample -> cuts inverted indexes.
+        Scores are cached in a heap and recomputed only for cuts affected by the newly selected nodes:
+        cuts containing them, cuts losing samples, and supersets of those.
+        Ties are broken by the order of the ranking, and a sample saved by a completed cut is removed
+        only from cuts that follow that cut in the ranking, as in get_updated_ranking.
+        '''
+        keys = list(self.ranking)
+        samples = [dict.fromkeys(self.ranking[key]) for key in keys]
+        node_keys = defaultdict(lambda: [])
+        sample_keys = defaultdict(lambda: [])
+        for i, key in enumerate(keys):
+            for n in key:
+                node_keys[n].append(i)
+            for sample_id in samples[i]:
+                sample_keys[sample_id].append(i)
+        subkeys = [[] for key in keys]
+        superkeys = [[] for key in keys]
+        for i, key in enumerate(keys):
+            candidates = min([node_keys[n] for n in key], key=len) if len(key) > 0 else range(len(keys))
+            for j in candidates:
+                if helpers.set_in_set(key, keys[j]):
+                    subkeys[j].append(i)
+                    superkeys[i].append(j)
+        for i in range(len(keys)):
+            subkeys[i].sort()
+        weights = self.get_sample_weights() if self.is_weighted else defaultdict(lambda: 1)
+        self.selection_order = []
+
+        cost = [len(key) for key in keys]
+        cost_buckets = defaultdict(lambda: set())
+        alive = [len(samples[i]) > 0 for i in range(len(keys))]
+        for i in range(len(keys)):
+            if alive[i]:
+                cost_buckets[cost[i]].add(i)
+        version = [0]*len(keys)
+        dirty = set(i for i in range(len(keys)) if alive[i])
+        heap = []
+
+        def kill(i):
+            alive[i] = False
+            cost_buckets[cost[i]].discard(i)
+            dirty.update(superkeys[i])
+
+        selected_nodes = set()
+        new_nodes = []
+        it = 0
+        while len(selected_nodes) < k:
+            it += 1
+            vacant_node_set_size = k - len(selected_nodes)
+            completed = []
+            for n in new_nodes:
+                for i in node_keys[n]:
+                    if alive[i]:
+                        cost_buckets[cost[i]].discard(i)
+                        cost[i] -= 1
+                        cost_buckets[cost[i]].add(i)
+                        dirty.add(i)
+            completed = sorted(cost_buckets[0])
+            for c in [c for c in cost_buckets if c > vacant_node_set_size]:
+                for i in list(cost_buckets[c]):
+                    kill(i)
+
+            first_saving_key = {}
+            for i in completed:
+                for sample_id in samples[i]:
+                    first_saving_key.setdefault(sample_id, i)
+            for sample_id, first in first_saving_key.items():
+                for j in sample_keys[sample_id]:
+                    if j > first and alive[j] and cost[j] > 0 and sample_id in samples[j]:
+                        del samples[j][sample_id]
+                        dirty.update(superkeys[j])
+                        if len(samples[j]) == 0:
+                            kill(j)
+            for i in completed:
+                kill(i)
+
+            for i in dirty:
+                if not alive[i]:
+                    continue
+                unique_sample_set = set()
+                weight_of_sample_set = 0
+                for j in subkeys[i]:
+                    if alive[j]:
+                        for sample_id in samples[j]:
+                            if sample_id not in unique_sample_set:
+                                weight_of_sample_set += weights[sample_id]
+                                unique_sample_set.add(sample_id)
+                version[i] += 1
+                heapq.heappush(heap, (-weight_of_sample_set/cost[i], i, version[i]))
+            dirty.clear()
+
+            best_key = None
+            while heap:
+                score, i, v = heapq.heappop(heap)
+                if alive[i] and version[i] == v:
+                    best_key = i
+                    break
+            if best_key == None:
+                break
+            new_nodes = [n for n in keys[best_key] if n not in selected_nodes]
+            selected_nodes.update(new_nodes)
+            self.selection_order += new_nodes
+        self.log["Scores are weighted"] = self.is_weighted
+        self.log["Blocking nodes selection iterations"] = it
+        return selected_nodes
+
     def set_sampled_nodes_weights(self, p):
         # for exact estimator this is activation probabilities of sample nodes
         self.sampled_nodes_weights = p
@@ -4,39 +4,350 @@ import random
 import numpy as np
 import logging
 from collections import defaultdict
-import warnings
+import sys
+import os
+import multiprocessing
+from scipy.stats import norm
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from CSRGraph import CSRGraph
+from RunningStats import RunningStats
+from WorldCache import WorldCache
+
+_worker_simulator = None
+
+def _init_worker(simulator):
+    # the simulator with its graph is sent once per worker process, not per task
+    global _worker_simulator
+    _worker_simulator = simulator
+
+def _run_chunk(chunk):
+    return _worker_simulator.run_chunk(*chunk)
 
 class Simulator():
 
-    def __init__(self, G, seeds):
-        self.G = G
+    ENGINES = ["networkx", "csr"]
+    ESTIMATORS = ["plain", "control variates", "quasi-random"]
+
+    def __init__(self, G, seeds, engine="networkx", seed=None, chunk_size=10, percentiles=(), node_counts=False, prune=False,
+                 world_cache=None, estimator="plain"):
+        '''
+        With prune, only the subgraph reachable from the seeds is simulated, which gives the same results in distribution.
+        Blocked nodes outside of it are ignored, and node counts are reported only for its nodes.
+        With a WorldCache, the csr engine reads worlds sampled by earlier runs with the same graph, seeds and seed
+        and stores newly sampled ones, so results are the same as without the cache.
+        Estimators other than plain Monte Carlo (csr engine) report the mean of saved nodes with a smaller variance
+        under 'saved nodes estimate', and confidence intervals and the stopping rule use it:
+        control variates correct the mean by the live edges of the seeds and the nodes activated by them in the first step,
+        whose expectations are known exactly; quasi-random draws every edge of the worlds of a chunk
+        from a randomly shifted lattice, and the variance is estimated from the means of independent chunks.
+        '''
+        if engine not in Simulator.ENGINES:
+            raise Exception("Unknown simulation engine: {}".format(engine))
+        if world_cache is not None and (engine != "csr" or seed is None):
+            raise Exception("Worlds can be cached only by the csr engine with a simulation seed")
+        if estimator not in Simulator.ESTIMATORS:
+            raise Exception("Unknown estimator: {}".format(estimator))
+        if estimator != "plain" and engine != "csr":
+            raise Exception("Estimator {} needs the csr engine".format(estimator))
+        self.log = {}
+        if prune:
+            G = self.prune(G, seeds)
+        self.csr = G if isinstance(G, CSRGraph) else None
+        self.G = G if self.csr is None or engine == "csr" else G.to_networkx()
         self.seeds = seeds
+        self.engine = engine
+        self.seed_sequence = np.random.SeedSequence(seed)
+        self.chunk_size = chunk_size
+        self.percentiles = percentiles
+        # per-node activation counts in the unblocked graph and with every blocked set, summed over worlds
+        self.node_counts = node_counts
+        self.activation_counts = None
         self.blocked = {}
-        self.log = {}
+        self.sequences = {}
+        # nodes of sequences in the graph, and their number in every prefix of the sequence
+        self.sequence_nodes = {}
+        self.sequence_prefixes = {}
+        self.world_cache = world_cache
+        self.cached_worlds = 0
+        self.estimator = estimator
+
+    def prune(self, G, seeds):
+        csr = G if isinstance(G, CSRGraph) else CSRGraph.from_networkx(G)
+        pruned, self.log['pruning'] = csr.prune(seeds)
+        return pruned if isinstance(G, CSRGraph) else pruned.to_networkx()
 
     def add_blocked(self, name, node_set):
+        if 'pruning' in self.log:
+            node_set = [n for n in node_set if self.G.has_node(n)]
         self.blocked[name] = node_set
 
-    def run(self, iterations):
+    def add_blocked_sequence(self, name, node_sequence):
+        '''
+        Every prefix of the sequence of distinct nodes is evaluated as a blocked set, in one search per sampled world
+        '''
+        if len(node_sequence) == 0:
+            raise Exception("Blocked sequence can not be empty")
+        if len(set(node_sequence)) < len(node_sequence):
+            raise Exception("Blocked sequence contains repeated nodes")
+        self.sequences[name] = node_sequence
+        in_graph = np.array([self.G.has_node(n) for n in node_sequence]) if 'pruning' in self.log else np.ones(len(node_sequence), dtype=bool)
+        self.sequence_nodes[name] = [n for n, kept in zip(node_sequence, in_graph) if kept]
+        self.sequence_prefixes[name] = np.cumsum(in_graph)
+
+    def run(self, iterations, workers=1, absolute_error=None, relative_error=None, confidence=0.95, time_budget=None, batch_size=None,
+            min_iterations=500):
+        '''
+        Iterations are split into chunks of a fixed size, each with its own RNG stream spawned from the master seed,
+        so the results depend only on the seed and not on the number of workers.
+        If a target error or a time budget is given, iterations run in batches until the confidence interval of saved nodes
+        of every blocked set (and every prefix of blocked sequences) is within the absolute or the relative error,
+        or the time budget expires, with at most the given number of iterations.
+        The precision target is not checked before min_iterations: blocked sets that save nodes only in rare worlds
+        have a zero sample variance until the first such world, which is not a precise estimate.
+        '''
         assert(sum([not self.G.has_node(n) for n in self.seeds]) == 0)
         for key in self.blocked:
             blocked_list = self.blocked[key]
             assert(sum([not self.G.has_node(n) for n in blocked_list]) == 0) # any blocked or seed node should exist in the graph
-        self.log['iterations'] = iterations
-        iteration_results = []
-        for i in range(iterations):
-            iteration_results.append(self.run_iteration())
-        self.log.update(self.merge_results_across_iterations(iteration_results))
+        for key in self.sequences:
+            assert(sum([not self.G.has_node(n) for n in self.sequence_nodes[key]]) == 0)
+        adaptive = absolute_error is not None or relative_error is not None or time_budget is not None
+        self.log['max iterations'] = iterations
+        self.log['min iterations'] = min_iterations
+        self.log['engine'] = self.engine
+        self.log['workers'] = workers
+        self.log['seed'] = self.seed_sequence.entropy
+        self.log['estimator'] = self.estimator
+        if self.engine == "csr":
+            self.prepare_csr()
+        if self.estimator == "control variates":
+            self.prepare_control_variates()
+        if self.node_counts:
+            self.prepare_node_counts()
+        if self.world_cache is not None:
+            self.prepare_world_cache()
+        if batch_size is None:
+            batch_size = self.chunk_size*workers if adaptive else iterations
+        batch_size = max(self.chunk_size, batch_size - batch_size % self.chunk_size) if adaptive else batch_size
+
+        t1 = time.time()
+        accumulators = {}
+        sampled_worlds = {}
+        pool = multiprocessing.Pool(workers, initializer=_init_worker, initargs=(self,)) if workers > 1 else None
+        try:
+            stopping = "iterations"
+            while self.get_iterations(accumulators) < iterations:
+                for chunk in self.run_batch(min(batch_size, iterations - self.get_iterations(accumulators)), pool):
+                    sampled_worlds.update(chunk.pop('worlds', {}))
+                    Simulator.merge_accumulators(accumulators, chunk)
+                if not adaptive:
+                    continue
+                if self.is_precise(accumulators, absolute_error, relative_error, confidence, min_iterations):
+                    stopping = "precision"
+                    break
+                if time_budget is not None and time.time() - t1 > time_budget:
+                    stopping = "time budget"
+                    break
+        finally:
+            if pool is not None:
+                pool.close()
+                pool.join()
+        self.log['iterations'] = self.get_iterations(accumulators)
+        if self.world_cache is not None:
+            self.store_worlds(sampled_worlds)
+        self.log['stopping'] = stopping
+        self.log['confidence'] = confidence
+        self.log['saved nodes confidence interval'] = self.get_saved_nodes_intervals(accumulators, confidence)
+        self.log.update(self.get_results(accumulators))
         return self.log
 
-    def run_iteration(self):
-        return self.simuation_as_possible_world()
+    def run_batch(self, iterations, pool=None):
+        '''
+        Yields accumulators of every chunk in the order of chunks, as they are computed, so that they are merged
+        one at a time instead of being kept for the whole batch
+        '''
+        chunk_sizes = [min(self.chunk_size, iterations - i) for i in range(0, iterations, self.chunk_size)]
+        chunks = list(zip(chunk_sizes, self.seed_sequence.spawn(len(chunk_sizes))))
+        if pool is not None:
+            return pool.imap(_run_chunk, chunks)
+        return (self.run_chunk(*chunk) for chunk in chunks)
+
+    def run_chunk(self, size, seed_sequence):
+        rng = np.random.default_rng(seed_sequence)
+        accumulators = {}
+        node_counts = self.create_node_counts() if self.node_counts else None
+        # chunk i holds worlds [i*chunk_size, i*chunk_size + size), it is read from the cache only if all of them are there
+        chunk = seed_sequence.spawn_key[-1]
+        worlds = None
+        if self.world_cache is not None and chunk*self.chunk_size + size <= self.cached_worlds:
+            worlds = self.world_cache.open(self.world_key)
+        sampled = [] if self.world_cache is not None and worlds is None else None
+        # one random shift of the lattice per edge, the same for all worlds of the chunk
+        shift = rng.random(self.csr.number_of_edges()) if self.estimator == "quasi-random" and worlds is None else None
+        for i in range(size):
+            world = None if worlds is None else WorldCache.unpack_world(worlds, chunk*self.chunk_size + i, len(self.csr), self.csr.number_of_edges())
+            lattice = None if shift is None else (shift, i/self.chunk_size)
+            self.add_to_accumulators(accumulators, self.run_iteration(rng, node_counts, world, sampled, lattice))
+        if node_counts is not None:
+            accumulators['node counts'] = node_counts
+        if self.estimator == "quasi-random" and size == self.chunk_size:
+            # chunks are independent replications, their means give the variance of the estimate
+            accumulators['chunks'] = {}
+            for group in ['solvers', 'sequences']:
+                for name in accumulators.get(group, {}):
+                    stats = accumulators['chunks'].setdefault(group, {})[name] = RunningStats()
+                    stats.add(accumulators[group][name]['saved nodes'].mean)
+        if sampled is not None:
+            accumulators['worlds'] = {chunk: sampled}
+        return accumulators
+
+    def add_to_accumulators(self, accumulators, results):
+        # accumulators mirror the nested dictionary of results of an iteration, histograms are kept for saved nodes
+        for key in results:
+            if isinstance(results[key], dict):
+                self.add_to_accumulators(accumulators.setdefault(key, {}), results[key])
+                continue
+            if key not in accumulators:
+                accumulators[key] = RunningStats(histogram=len(self.percentiles) > 0 and key == 'saved nodes', covariance=key == 'control variates')
+            accumulators[key].add(results[key])
+
+    @staticmethod
+    def merge_accumulators(accumulators, other):
+        for key in other:
+            if isinstance(other[key], dict):
+                Simulator.merge_accumulators(accumulators.setdefault(key, {}), other[key])
+            elif key not in accumulators:
+                accumulators[key] = other[key]
+            elif isinstance(other[key], np.ndarray):
+                accumulators[key] += other[key]
+            else:
+                accumulators[key].merge(other[key])
 
-    def simuation_as_possible_world(self):
+    @staticmethod
+    def get_iterations(accumulators):
+        return accumulators['simulation time'].n if 'simulation time' in accumulators else 0
+
+    def get_saved_nodes_estimate(self, accumulators, group, name):
+        '''
+        Mean of saved nodes by the estimator of the simulator, and the variance of one world of that estimator
+        '''
+        saved = accumulators[group][name]['saved nodes']
+        if self.estimator == "control variates":
+            control_means = self.control_means[group][name]
+            estimate = accumulators[group][name]['control variates'].get_control_variate_stats(control_means)
+        elif self.estimator == "quasi-random":
+            chunks = accumulators.get('chunks', {}).get(group, {}).get(name, RunningStats())
+            var = chunks.get_var()*self.chunk_size if chunks.n > 1 else saved.mean*np.nan
+            estimate = {'mean': saved.mean, 'var': var, 'plain var': saved.get_var()}
+        else:
+            return {'mean': saved.mean, 'var': saved.get_var()}
+        with np.errstate(divide='ignore', invalid='ignore'):
+            estimate['variance ratio'] = np.divide(estimate['plain var'], estimate['var'])
+        return {key: np.asarray(value).item() if np.ndim(value) == 0 else value for key, value in estimate.items()}
+
+    def get_saved_nodes_intervals(self, accumulators, confidence):
         '''
-        Allows to calculate the number of saved nodes
+        Half-widths of the normal confidence intervals of the mean number of saved nodes
+        '''
+        z = norm.ppf(0.5 + confidence/2)
+        n = self.get_iterations(accumulators)
+        intervals = {'solvers': {}, 'sequences': {}}
+        for group in intervals:
+            for name in accumulators.get(group, {}):
+                interval = z*np.sqrt(self.get_saved_nodes_estimate(accumulators, group, name)['var']/n)
+                intervals[group][name] = interval.tolist() if isinstance(interval, np.ndarray) else float(interval)
+        return intervals
+
+    def is_precise(self, accumulators, absolute_error, relative_error, confidence, min_iterations=500):
+        if self.get_iterations(accumulators) < max(min_iterations, 2) or (absolute_error is None and relative_error is None):
+            return False
+        intervals = self.get_saved_nodes_intervals(accumulators, confidence)
+        for group in intervals:
+            for name in intervals[group]:
+                interval = np.atleast_1d(intervals[group][name])
+                target = np.zeros(len(interval))
+                if absolute_error is not None:
+                    target = np.maximum(target, absolute_error)
+                if relative_error is not None:
+                    target = np.maximum(target, relative_error*np.abs(np.atleast_1d(self.get_saved_nodes_estimate(accumulators, group, name)['mean'])))
+                if not np.all(interval <= target):
+                    return False
+        return True
+
+    def get_results(self, accumulators):
+        '''
+        Mean, variance and percentiles of every result, for sequences as a list of results per prefix length
+        '''
+        estimates = {}
+        if self.estimator != "plain":
+            for group in ['solvers', 'sequences']:
+                for name in accumulators.get(group, {}):
+                    estimates[(group, name)] = self.get_saved_nodes_estimate(accumulators, group, name)
+                    accumulators[group][name] = dict(accumulators[group][name])
+                    accumulators[group][name].pop('control variates', None)
+        accumulators = dict(accumulators)
+        accumulators.pop('chunks', None)
+        self.activation_counts = accumulators.pop('node counts', None)
+        merged = Simulator.get_stats(accumulators, self.percentiles)
+        for (group, name), estimate in estimates.items():
+            merged[group][name]['saved nodes estimate'] = estimate
+        for name in merged.get('sequences', {}):
+            stats = merged['sequences'][name]
+            merged['sequences'][name] = [{key: {s: np.asarray(stats[key][s])[i].item() for s in stats[key]} for key in stats}
+                                         for i in range(len(self.sequences[name]))]
+        return merged
+
+    @staticmethod
+    def get_stats(accumulators, percentiles):
+        if isinstance(accumulators, RunningStats):
+            return accumulators.get_stats(percentiles)
+        return {key: Simulator.get_stats(accumulators[key], percentiles) for key in accumulators}
+
+    def run_iteration(self, rng, node_counts=None, world=None, sampled=None, lattice=None):
+        return self.simuation_as_possible_world(rng, node_counts, world, sampled, lattice)
+
+    def prepare_node_counts(self):
+        self.node_ids = self.csr.node_ids if self.engine == "csr" else np.array(list(self.G.nodes()))
+        self.node_index = None if self.engine == "csr" else {n: i for i, n in enumerate(self.node_ids.tolist())}
+
+    def create_node_counts(self):
+        node_counts = {'unblocked': np.zeros(len(self.node_ids), dtype=np.int64), 'solvers': {}}
+        for name in self.blocked:
+            node_counts['solvers'][name] = np.zeros(len(self.node_ids), dtype=np.int64)
+        return node_counts
+
+    def save_activation_counts(self, path):
+        '''
+        Writes node ids, the number of worlds, and activation counts of every node in the unblocked graph and
+        with every blocked set to a compressed .npz file. Dividing by the number of worlds gives activation probabilities,
+        the difference between the unblocked and a blocked count gives the probability that blocking saves the node.
+        '''
+        if self.activation_counts is None:
+            raise Exception("Simulator was not run with node counts")
+        arrays = {"blocked " + str(name): counts for name, counts in self.activation_counts['solvers'].items()}
+        np.savez_compressed(path, node_ids=self.node_ids, iterations=self.log['iterations'],
+                            unblocked=self.activation_counts['unblocked'], **arrays)
+
+    def simuation_as_possible_world(self, rng, node_counts=None, world=None, sampled=None, lattice=None):
+        '''
+        Allows to calculate the number of saved nodes.
+        For the csr engine, a given world (live edges, active nodes, cascade steps) is evaluated instead of a sampled one,
+        and sampled worlds are packed and appended to the sampled list.
         '''
         t1 = time.time()
+        if self.engine == "csr":
+            live, active, iterations = self.sample_live_edges_csr(rng, lattice) if world is None else world
+            if sampled is not None:
+                sampled.append(WorldCache.pack_world(live, active, iterations))
+            results = self.evaluate_blocked_csr(live, active, iterations, node_counts)
+        else:
+            active_subgraph, iterations = self.sample_active_subgraph(rng)
+            results = self.evaluate_blocked(active_subgraph, iterations, node_counts)
+        t2 = time.time()
+        results['simulation time'] = t2 - t1
+        return results
+
+    def sample_active_subgraph(self, rng):
         front_nodes = self.seeds
         active_series = []
         active_series.append(len(front_nodes))
@@ -48,29 +359,239 @@ class Simulator():
         active_subgraph = nx.DiGraph()
         active_subgraph.add_nodes_from([key for key in active])
         while (len(front_nodes) > 0):
-            front_edges = self.get_front_edges(front_nodes)
+            front_edges = self.get_front_edges(front_nodes, rng)
             active_edges.update(front_edges)
-            front_nodes = [e[1] for e in front_edges if e[1] not in active]
+            front_nodes = list(dict.fromkeys([e[1] for e in front_edges if e[1] not in active]))
             active.update(front_nodes)
             active_series.append(active_series[-1]+len(front_nodes))
             iterations += 1
         active_subgraph.add_edges_from(active_edges)
+        return active_subgraph, iterations
+
+    def prepare_csr(self):
+        if self.csr is None:
+            self.csr = CSRGraph.from_networkx(self.G)
+        self.seed_indices = np.unique(self.csr.to_index(self.seeds))
+        self.blocked_masks = {}
+        for name in self.blocked:
+            mask = np.zeros(len(self.csr), dtype=bool)
+            mask[self.csr.to_index(self.blocked[name])] = True
+            self.blocked_masks[name] = mask
+        self.blocked_indices = {name: np.flatnonzero(self.blocked_masks[name]) for name in self.blocked}
+        self.sequence_indices = {name: self.csr.to_index(self.sequence_nodes[name]) for name in self.sequences}
+
+    def prepare_control_variates(self):
+        '''
+        Expected live out-edges of the seeds, and for every node the probability to be activated by the seeds in the first step
+        '''
+        csr = self.csr
+        self.seed_edges = csr.get_out_edges(self.seed_indices)
+        probabilities = np.clip(csr.weights[self.seed_edges], 0., 1.)
+        with np.errstate(divide='ignore'):
+            not_activated = np.bincount(csr.indices[self.seed_edges], np.log1p(-probabilities), minlength=len(csr))
+        self.step_one = -np.expm1(not_activated)
+        self.step_one[self.seed_indices] = 0.
+        common = [probabilities.sum(), self.step_one.sum()]
+        self.control_means = {'solvers': {}, 'sequences': {}}
+        for name in self.blocked:
+            self.control_means['solvers'][name] = np.array(common + [self.step_one[self.blocked_indices[name]].sum()])
+        for name in self.sequences:
+            prefixes = self.get_prefix_sums(name, self.step_one[self.sequence_indices[name]])
+            self.control_means['sequences'][name] = np.column_stack([np.full((len(prefixes), 2), common), prefixes])
+
+    def get_prefix_sums(self, name, values):
+        # sums of values of the sequence nodes in the graph over every prefix of the sequence
+        return np.concatenate([[0], np.cumsum(values)])[self.sequence_prefixes[name]]
+
+    def prepare_world_cache(self):
+        self.world_key = WorldCache.get_key(self.csr, self.seed_indices, self.seed_sequence.entropy, self.chunk_size,
+                                            self.estimator == "quasi-random")
+        self.cached_worlds = self.world_cache.lookup(self.world_key, len(self.csr), self.csr.number_of_edges())
+        self.log['world cache'] = {'key': self.world_key, 'cached worlds': self.cached_worlds}
+
+    def store_worlds(self, sampled_worlds):
+        if len(sampled_worlds) == 0:
+            return
+        self.log['world cache']['stored worlds'] = self.world_cache.store(
+            self.world_key, sampled_worlds, self.chunk_size, self.cached_worlds, len(self.csr), self.csr.number_of_edges(),
+            {'graph_id': self.csr.graph.get('graph_id'), 'seed': self.seed_sequence.entropy})
+
+    def sample_live_edges_csr(self, rng, lattice=None):
+        '''
+        Samples a live-edge world by expanding the whole cascade frontier at once over CSR arrays,
+        with one random draw per block of frontier edges. With a lattice (shifts of all edges, offset of the world),
+        the uniform number of an edge is the fractional part of its shift plus the offset.
+        Returns the mask of live edges, the mask of active nodes and the number of cascade steps.
+        Edges of inactive nodes are never tested and stay dead, which does not affect any blocked set.
+        '''
+        csr = self.csr
+        front = self.seed_indices
+        active = np.zeros(len(csr), dtype=bool)
+        active[front] = True
+        live = np.zeros(csr.number_of_edges(), dtype=bool)
+        iterations = 0
+        while len(front) > 0:
+            edges = csr.get_out_edges(front)
+            draws = rng.random(len(edges)) if lattice is None else np.mod(lattice[0][edges] + lattice[1], 1.)
+            edges = edges[draws <= csr.weights[edges]]
+            live[edges] = True
+            targets = np.unique(csr.indices[edges])
+            front = targets[~active[targets]]
+            active[front] = True
+            iterations += 1
+        return live, active, iterations
+
+    def count_reachable_csr(self, live, blocked_mask):
+        '''
+        Breadth-first search from the seeds over live edges, skipping blocked nodes
+        '''
+        csr = self.csr
+        reached = blocked_mask.copy()
+        reached[self.seed_indices] = True
+        front = self.seed_indices[~blocked_mask[self.seed_indices]]
+        count = len(self.seed_indices)
+        while len(front) > 0:
+            edges = csr.get_out_edges(front)
+            edges = edges[live[edges]]
+            targets = np.unique(csr.indices[edges])
+            front = targets[~reached[targets]]
+            reached[front] = True
+            count += len(front)
+        return count, reached
+
+    def count_reachable_prefixes_csr(self, live, sequence):
+        '''
+        Activated nodes for every prefix of the blocked sequence: the search starts with all nodes of the sequence blocked,
+        then unblocks them from the last one and continues from an unblocked node if a reached node has a live edge to it.
+        Returns the counts for prefixes of length 0, 1, ..., len(sequence).
+        '''
+        blocked = np.zeros(len(self.csr), dtype=bool)
+        blocked[sequence] = True
+        reached = np.zeros(len(self.csr), dtype=bool)
+        reached[self.seed_indices] = True
+        touched = reached.copy()
+        count = self.expand_reachable_csr(live, self.seed_indices[~blocked[self.seed_indices]], reached, blocked, touched, len(self.seed_indices))
+        counts = [count]
+        for node in sequence[::-1].tolist():
+            blocked[node] = False
+            if touched[node]:
+                count += not reached[node]
+                reached[node] = True
+                count = self.expand_reachable_csr(live, np.array([node]), reached, blocked, touched, count)
+            counts.append(count)
+        return counts[::-1]
+
+    def expand_reachable_csr(self, live, front, reached, blocked, touched, count):
+        csr = self.csr
+        while len(front) > 0:
+            edges = csr.get_out_edges(front)
+            edges = edges[live[edges]]
+            targets = np.unique(csr.indices[edges])
+            touched[targets] = True
+            front = targets[~reached[targets] & ~blocked[targets]]
+            reached[front] = True
+            count += len(front)
+        return count
+
+    def evaluate_blocked_csr(self, live, active, iterations, node_counts=None):
+        '''
+        A blocked set with no active node in the unblocked world saves no node, and is not searched
+        '''
+        active_node_amount = int(active.sum())
+        if node_counts is not None:
+            node_counts['unblocked'] += active
+        if self.estimator == "control variates":
+            seed_live = self.seed_edges[live[self.seed_edges]]
+            step_one = np.unique(self.csr.indices[seed_live])
+            step_one = step_one[self.step_one[step_one] > 0]
+        results = {}
+        results['iterations until termination in unblocked graph'] = iterations
+        results['active nodes in unblocked graph'] = active_node_amount
+        results['solvers'] = {}
+        for blocked_set_name in self.blocked:
+            if not np.any(active[self.blocked_indices[blocked_set_name]]):
+                activated_node_amount, reached = active_node_amount, active.copy()
+            else:
+                activated_node_amount, reached = self.count_reachable_csr(live, self.blocked_masks[blocked_set_name])
+            if node_counts is not None:
+                # reached nodes include blocked nodes, which are not activated unless they are seeds
+                reached &= ~self.blocked_masks[blocked_set_name]
+                reached[self.seed_indices] = True
+                node_counts['solvers'][blocked_set_name] += reached
+            results['solvers'][blocked_set_name] = self.get_blocked_results(active_node_amount, activated_node_amount)
+            if self.estimator == "control variates":
+                results['solvers'][blocked_set_name]['control variates'] = np.array([
+                    active_node_amount - activated_node_amount, len(seed_live), len(step_one),
+                    np.sum(self.blocked_masks[blocked_set_name][step_one])])
+        results['sequences'] = {}
+        for name in self.sequences:
+            if not np.any(active[self.sequence_indices[name]]):
+                counts = [active_node_amount]*(len(self.sequence_indices[name]) + 1)
+            else:
+                counts = self.count_reachable_prefixes_csr(live, self.sequence_indices[name])
+            results['sequences'][name] = self.get_blocked_results(active_node_amount, np.array(counts)[self.sequence_prefixes[name]])
+            if self.estimator == "control variates":
+                saved = results['sequences'][name]['saved nodes']
+                blocked_step_one = self.get_prefix_sums(name, np.isin(self.sequence_indices[name], step_one))
+                results['sequences'][name]['control variates'] = np.column_stack([
+                    saved, np.full(len(saved), len(seed_live)), np.full(len(saved), len(step_one)), blocked_step_one])
+        return results
+
+    def evaluate_blocked(self, active_subgraph, iterations, node_counts=None):
+        if node_counts is not None:
+            node_counts['unblocked'][[self.node_index[n] for n in active_subgraph]] += 1
         results = {}
         results['iterations until termination in unblocked graph'] = iterations
         results['active nodes in unblocked graph'] = len(active_subgraph)
         results['solvers'] = {}
         for blocked_set_name in self.blocked:
             blocked_list = self.blocked[blocked_set_name]
-            results['solvers'][blocked_set_name] = {}
             active_subgraph_with_blocked = active_subgraph.subgraph([node for node in active_subgraph.nodes() if node not in blocked_list])
             active_subgraph_with_blocked = self.get_reachable_subgraph_from_seeds(active_subgraph_with_blocked)
-            activated_node_amount = len(active_subgraph_with_blocked)
-            saved_node_amount = results['active nodes in unblocked graph'] - activated_node_amount
-            results['solvers'][blocked_set_name]['activated nodes'] = activated_node_amount
-            results['solvers'][blocked_set_name]['saved nodes'] = saved_node_amount
-            results['solvers'][blocked_set_name]['fraction of saved nodes to active nodes'] = saved_node_amount/results['active nodes in unblocked graph']
-        t2 = time.time()
-        results['simulation time'] = t2 - t1
+            if node_counts is not None:
+                node_counts['solvers'][blocked_set_name][[self.node_index[n] for n in active_subgraph_with_blocked]] += 1
+            results['solvers'][blocked_set_name] = self.get_blocked_results(len(active_subgraph), len(active_subgraph_with_blocked))
+        results['sequences'] = {}
+        for name in self.sequences:
+            counts = self.count_reachable_prefixes(active_subgraph, self.sequence_nodes[name])
+            results['sequences'][name] = self.get_blocked_results(len(active_subgraph), np.array(counts)[self.sequence_prefixes[name]])
+        return results
+
+    def count_reachable_prefixes(self, active_subgraph, sequence):
+        '''
+        The same search as count_reachable_prefixes_csr over the active subgraph
+        '''
+        blocked = set(sequence)
+        reached = set(self.seeds)
+        touched = set(self.seeds)
+        counts = [self.expand_reachable(active_subgraph, [n for n in reached if n not in blocked], reached, blocked, touched)]
+        for node in reversed(sequence):
+            blocked.discard(node)
+            if node in touched:
+                reached.add(node)
+                self.expand_reachable(active_subgraph, [node], reached, blocked, touched)
+            counts.append(len(reached))
+        return counts[::-1]
+
+    def expand_reachable(self, active_subgraph, front, reached, blocked, touched):
+        while len(front) > 0:
+            new_front = []
+            for v in front:
+                for u in active_subgraph.successors(v):
+                    touched.add(u)
+                    if u not in reached and u not in blocked:
+                        reached.add(u)
+                        new_front.append(u)
+            front = new_front
+        return len(reached)
+
+    @staticmethod
+    def get_blocked_results(active_node_amount, activated_node_amount):
+        results = {}
+        saved_node_amount = active_node_amount - activated_node_amount
+        results['activated nodes'] = activated_node_amount
+        results['saved nodes'] = saved_node_amount
+        results['fraction of saved nodes to active nodes'] = saved_node_amount/active_node_amount
         return results
 
     def get_reachable_subgraph_from_seeds(self, G):
@@ -80,34 +601,10 @@ class Simulator():
         node_subset = nx.descendants(G, "superseed")
         return G.subgraph(node_subset - set(["superseed"]))
 
-    def get_front_edges(self, front_nodes):
+    def get_front_edges(self, front_nodes, rng):
         new_front_edges = []
         for v in front_nodes:
             for u in self.G.successors(v):
-                if (np.random.rand() <= self.G[v][u]['weight']):
+                if (rng.random() <= self.G[v][u]['weight']):
                     new_front_edges.append((v,u))
         return new_front_edges
-
-    def merge_results_across_iterations(self, results):
-        assert(len(results) > 0)
-        r = results[0]
-        N = len(results)
-        merged = {}
-        for key in r:
-            if key == "solvers":
-                continue
-            merged[key] = self.get_list_stats([results[i][key] for i in range(N)])
-        merged['solvers'] = {}
-        for alg in r['solvers']:
-            merged['solvers'][alg] = {}
-            for key in r['solvers'][alg]:
-                l = [results[i]['solvers'][alg][key] for i in range(N)]
-                merged['solvers'][alg][key] = self.get_list_stats([results[i]['solvers'][alg][key] for i in range(N)])
-        return merged
-
-    def get_list_stats(self, l):
-        s = {}
-        warnings.simplefilter("ignore", category=RuntimeWarning)
-        s['mean'] = np.mean(l)
-        s['var'] = np.var(l, ddof=1)
-        return s
@@ -1,7 +1,16 @@
 import time
+import sys
+import os
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from CSRGraph import CSRGraph
 
 class Solver:
-    def __init__(self, G, seeds, k, **params):
+    # solvers that can run directly on CSRGraph arrays, other solvers get the graph converted to NetworkX
+    supports_csr = False
+    # greedy solvers: the first i blocked nodes of the solution for k are the solution for i <= k
+    prefix_solutions = False
+
+    def __init__(self, G, seeds, k, cache=None, **params):
         if len(G) == 0:
             raise Exception("Graph can not be empty")
         if len(seeds) == 0:
@@ -10,16 +19,64 @@ class Solver:
             raise Exception("Seeds can not be blocked: too large k")
         if k == 0:
             raise Exception("k should be greater than 0")
-        self.G = G.copy()
         self.seeds = [int(node) for node in seeds]
         self.k = int(k)
         self.log = {}
         self.log['created'] = time.time()
         self.params = params
+        if params.get("prune", False) or "prune_hops" in params or "prune_probability" in params:
+            G = self.prune(G)
+            if self.k == 0:
+                raise Exception("No nodes are reachable from the seeds, there is nothing to block")
+        # the input graph is shared between solvers as a read-only view, solvers that remove nodes or change weights
+        # keep the changes on the side (see DomSolver) instead of copying the graph
+        if isinstance(G, CSRGraph):
+            self.G = G if self.supports_csr else G.to_networkx().copy(as_view=True)
+        else:
+            self.G = G.copy(as_view=True)
+        # results that do not depend on k, shared between solvers of the same graph, seeds and parameters
+        self.cache = {} if cache is None else cache
         self.clear()
 
     def clear(self):
         pass
 
+    def prune(self, G):
+        '''
+        Returns the subgraph reachable from the seeds (within prune_hops edges and prune_probability, if given).
+        Nodes keep their ids, so blocked nodes need no mapping back. Other nodes can not be saved by blocking,
+        k is reduced if fewer nodes are reachable.
+        '''
+        csr = G if isinstance(G, CSRGraph) else CSRGraph.from_networkx(G)
+        pruned, self.log['Pruning'] = csr.prune(self.seeds, self.params.get("prune_hops"), self.params.get("prune_probability"))
+        self.k = max(min(self.k, len(pruned) - len(self.seeds)), 0)
+        self.log['Pruning']['k'] = self.k
+        return pruned
+
+    def get_selection_sequence(self):
+        '''
+        Blocked nodes in the order of selection for the budget k of the solver, every prefix is a solution for a smaller budget
+        '''
+        if not self.prefix_solutions:
+            raise Exception("{} solutions for smaller k are not prefixes of the solution for k".format(self.get_name()))
+        if 'Blocked nodes' not in self.log:
+            self.run()
+        return list(self.log['Blocked nodes'])
+
+    def get_cached(self, key, compute):
+        if key not in self.cache:
+            self.cache[key] = compute()
+        return self.cache[key]
+
+    def get_csr(self):
+        if isinstance(self.G, CSRGraph):
+            return self.G
+        return CSRGraph.from_networkx(self.G)
+
+    def get_networkx(self):
+        if isinstance(self.G, CSRGraph):
+            return self.G.to_networkx()
+        return self.G
+
     def get_name(self):
         return self.__class__.__name__
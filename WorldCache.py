@@ -0,0 +1,138 @@
+'''
+Persistent cache of sampled live-edge worlds of the CSR simulation engine.
+Worlds of a graph, a seed set and a master seed are stored in one directory as bit-packed masks of live edges and
+of nodes active in the unblocked graph, one row per world, and memory-mapped by later runs, which evaluate
+new blocked sets on the same worlds without sampling them again. The directory is kept below a size limit
+by removing the least recently used entries.
+'''
+
+import os
+import json
+import shutil
+import hashlib
+import logging
+import numpy as np
+
+class WorldCache:
+
+    ARRAYS = ["live", "active", "steps"]
+
+    def __init__(self, path, max_size=None):
+        '''
+        max_size is the limit of the total size of all entries in bytes, None for no limit
+        '''
+        self.path = path
+        self.max_size = max_size
+        os.makedirs(path, exist_ok=True)
+
+    @staticmethod
+    def get_key(csr, seed_indices, entropy, chunk_size, quasi_random=False):
+        '''
+        Content address of the worlds: the graph arrays, the seeds, the master seed and the chunk size
+        (worlds are drawn from one random stream per chunk) and the sampling determine every sampled world
+        '''
+        h = hashlib.md5()
+        for array in [csr.indptr, csr.indices, csr.weights]:
+            h.update(np.ascontiguousarray(array).view(np.uint8).data)
+        params = {'graph': h.hexdigest(), 'graph_id': csr.graph.get('graph_id'), 'seeds': np.asarray(seed_indices).tolist(),
+                  'seed': entropy, 'chunk size': chunk_size, 'quasi-random': quasi_random}
+        return hashlib.md5(json.dumps(params, sort_keys=True, default=str).encode('utf-8')).hexdigest()
+
+    def get_entry_path(self, key):
+        return os.path.join(self.path, key)
+
+    def lookup(self, key, nodes, edges):
+        '''
+        Returns the number of cached worlds of the key and marks the entry as recently used
+        '''
+        meta_path = os.path.join(self.get_entry_path(key), "meta.json")
+        if not os.path.isfile(meta_path):
+            return 0
+        meta = json.load(open(meta_path))
+        if meta['nodes'] != nodes or meta['edges'] != edges:
+            raise Exception("Cached worlds {} do not match the graph".format(key))
+        os.utime(meta_path)
+        return meta['worlds']
+
+    def open(self, key):
+        return {name: np.load(os.path.join(self.get_entry_path(key), name + ".npy"), mmap_mode='r') for name in WorldCache.ARRAYS}
+
+    @staticmethod
+    def pack_world(live, active, steps):
+        return np.packbits(live), np.packbits(active), steps
+
+    @staticmethod
+    def unpack_world(worlds, i, nodes, edges):
+        '''
+        Returns the mask of live edges, the mask of active nodes and the number of cascade steps of world i
+        '''
+        live = np.unpackbits(worlds['live'][i], count=edges).view(bool)
+        active = np.unpackbits(worlds['active'][i], count=nodes).view(bool)
+        return live, active, int(worlds['steps'][i])
+
+    def store(self, key, chunks, chunk_size, cached, nodes, edges, meta=None):
+        '''
+        Writes worlds [0, n) of the key, taking chunk i from chunks[i] (a list of packed worlds) if it was sampled
+        and from the cached entry otherwise, then evicts old entries. Returns the number of stored worlds.
+        '''
+        n = max([i*chunk_size + len(chunk) for i, chunk in chunks.items()] + [cached])
+        size = n*((edges + 7)//8 + (nodes + 7)//8 + 8)
+        if self.max_size is not None and size > self.max_size:
+            logging.warning("Worlds of size %d exceed the world cache size %d and are not stored." % (size, self.max_size))
+            return cached
+        old = self.open(key) if cached > 0 else None
+        path = self.get_entry_path(key)
+        # written under a temporary name and renamed, so an interrupted run never leaves a partial entry
+        tmp_path = path + ".tmp" + str(os.getpid())
+        os.makedirs(tmp_path)
+        shapes = {'live': (n, (edges + 7)//8), 'active': (n, (nodes + 7)//8), 'steps': (n,)}
+        arrays = {name: np.lib.format.open_memmap(os.path.join(tmp_path, name + ".npy"), mode='w+',
+                                                  dtype=np.int64 if name == 'steps' else np.uint8, shape=shapes[name])
+                  for name in WorldCache.ARRAYS}
+        for start in range(0, n, chunk_size):
+            chunk = chunks.get(start//chunk_size)
+            end = min(start + chunk_size, n)
+            for j, name in enumerate(WorldCache.ARRAYS):
+                arrays[name][start:end] = old[name][start:end] if chunk is None else [world[j] for world in chunk]
+        for array in arrays.values():
+            array.flush()
+        del arrays, old
+        json.dump(dict(meta or {}, worlds=n, nodes=nodes, edges=edges, **{'chunk size': chunk_size}),
+                  open(os.path.join(tmp_path, "meta.json"), "w"))
+        if os.path.isdir(path):
+            shutil.rmtree(path)
+        os.rename(tmp_path, path)
+        self.evict(keep=key)
+        return n
+
+    def get_entries(self):
+        '''
+        Returns (last use, size, key) of every entry
+        '''
+        entries = []
+        for key in os.listdir(self.path):
+            meta_path = os.path.join(self.get_entry_path(key), "meta.json")
+            if not os.path.isfile(meta_path):
+                continue
+            size = sum([os.path.getsize(os.path.join(self.get_entry_path(key), name)) for name in os.listdir(self.get_entry_path(key))])
+            entries.append((os.path.getmtime(meta_path), size, key))
+        return entries
+
+    def evict(self, keep=None):
+        '''
+        Removes the least recently used entries, except keep, until the cache is within its size limit
+        '''
+        if self.max_size is None:
+            return []
+        entries = sorted(self.get_entries())
+        total = sum([size for _, size, _ in entries])
+        evicted = []
+        for last_use, size, key in entries:
+            if total <= self.max_size:
+                break
+            if key == keep:
+                continue
+            shutil.rmtree(self.get_entry_path(key), ignore_errors=True)
+            total -= size
+            evicted.append(key)
+        return evicted
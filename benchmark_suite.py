@@ -0,0 +1,174 @@
+'''
+Measures how solvers and the simulator scale with the graph size.
+Graphs of every type and size are generated with Generator from a fixed seed, every algorithm blocks k nodes,
+and one Simulator evaluates all blocked sets. Each step records wall time, peak memory of Python and NumPy
+allocations (tracemalloc, measured in a separate run so that tracing does not slow down the timed run)
+and the objective of every simulation engine. The JSON report holds the environment (commit, versions) and one record per step,
+and --compare prints the time and memory ratios to an earlier report, e.g. of another commit.
+
+Report (JSON):
+{
+    "environment": {"commit": ..., "python": ..., "numpy": ..., "scipy": ..., "networkx": ..., "cpus": ..., "arguments": {...}},
+    "records": [{"graph type": "grid", "size": 1000, "nodes": 1024, "edges": 1984, "graph id": ..., "step": "DomFast", "k": 10,
+                 "time": 0.1, "times": [0.1], "peak memory": 123456, "solver time": 0.09, "saved nodes": {"csr": 12.5},
+                 "saved nodes confidence interval": {"csr": 0.4}, "blocked nodes": [...]}]
+}
+'''
+
+import os
+import sys
+import math
+import time
+import json
+import platform
+import argparse
+import subprocess
+import tracemalloc
+import multiprocessing
+import numpy as np
+import scipy
+import networkx as nx
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from run_batch import *
+from Generator import Generator
+
+GRAPHS = {
+    # generator parameters for a graph of about the given number of nodes
+    "grid": lambda size: {"n": int(round(math.sqrt(size)))},
+    "powerlaw_cluster": lambda size: {"n": size, "m": 2, "p": 0.1},
+    "binomial": lambda size: {"n": size, "p": 4./size}
+}
+
+ALGORITHMS = ["Degree",
+              {"name": "Dom", "params": {"fast": 1}, "label": "DomFast"},
+              "Dom",
+              "NetShield",
+              {"name": "NetShape", "params": {"epsilon": 1, "tolerance": 0.001}}]
+
+def measure(task, repeats, memory):
+    '''
+    Returns the result of the last run, the times of all runs and the peak traced memory of one more run
+    '''
+    times = []
+    for i in range(repeats):
+        t1 = time.perf_counter()
+        result = task()
+        times.append(time.perf_counter() - t1)
+    peak = None
+    if memory:
+        tracemalloc.start()
+        task()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, times, peak
+
+def get_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "HEAD"], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def get_environment(args):
+    return {"commit": get_commit(),
+            "date": time.strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "scipy": scipy.__version__,
+            "networkx": nx.__version__,
+            "platform": platform.platform(),
+            "cpus": multiprocessing.cpu_count(),
+            "arguments": vars(args)}
+
+def benchmark_graph(graph_type, size, algorithms, args):
+    params = dict(GRAPHS[graph_type](size), graph_type=graph_type, both_directions=args.both_directions,
+                  weight_scale=args.weight_scale, random_weight=1, seed=args.seed)
+    generator = Generator(params)
+    G = next(generator.generate_csr(cache_dir=args.cache_dir))
+    seeds = np.random.default_rng(args.seed).choice(G.node_ids, args.number_of_seeds, replace=False)
+    graph = {"graph type": graph_type, "size": size, "nodes": len(G), "edges": G.number_of_edges(), "graph id": G.graph.get("graph_id")}
+    print("Graph %s of size %d: %d nodes, %d edges" % (graph_type, size, len(G), G.number_of_edges()))
+
+    records = []
+    def add_record(step, times, peak, **values):
+        records.append(dict(graph, step=step, k=args.nodes_to_block, time=min(times), times=times, **{"peak memory": peak}, **values))
+        print("  %-24s %10.5fs %12s" % (step, min(times), "" if peak is None else "%1.1f MB" % (peak/2.**20)))
+
+    nx_graph, times, peak = measure(G.to_networkx, args.repeats, not args.no_memory)
+    add_record("to_networkx", times, peak)
+    blocked = {}
+    for label, name, params in algorithms:
+        Solver = eval(name + "Solver")
+        graph_for_solver = G if Solver.supports_csr else nx_graph
+        def run():
+            solver = Solver(graph_for_solver, seeds, args.nodes_to_block, **params)
+            solver.run()
+            return solver
+        solver, times, peak = measure(run, args.repeats, not args.no_memory)
+        blocked[label] = solver.log["Blocked nodes"]
+        add_record(label, times, peak, **{"solver time": solver.log["Total time"], "blocked nodes": blocked[label]})
+
+    for engine in args.engines:
+        def simulate():
+            simulator = Simulator(G, seeds, engine=engine, seed=args.seed)
+            for label in blocked:
+                simulator.add_blocked(label, blocked[label])
+            return simulator.run(args.simulation_iterations, workers=args.workers)
+        results, times, peak = measure(simulate, args.repeats, not args.no_memory)
+        add_record("Simulator (%s)" % engine, times, peak, iterations=results["iterations"], **{"blocked sets": len(blocked)})
+        # the objective of every solver, by the engine that simulated it
+        for record in records:
+            if record["step"] in blocked:
+                record.setdefault("saved nodes", {})[engine] = results["solvers"][record["step"]]["saved nodes"]["mean"]
+                record.setdefault("saved nodes confidence interval", {})[engine] = \
+                    results["saved nodes confidence interval"]["solvers"][record["step"]]
+    return records
+
+def get_key(record):
+    return (record["graph type"], record["size"], record["step"])
+
+def compare(records, previous):
+    previous = {get_key(record): record for record in previous["records"]}
+    print("Compared to the previous report (time and memory ratios, < 1 is faster or smaller):")
+    for record in records:
+        old = previous.get(get_key(record))
+        if old is None:
+            continue
+        memory = "" if record["peak memory"] is None or not old.get("peak memory") else "%1.2fx" % (record["peak memory"]/old["peak memory"])
+        saved, old_saved = record.get("saved nodes", {}), old.get("saved nodes", {})
+        old_saved = old_saved if isinstance(old_saved, dict) else {}  # reports before objectives were kept per engine
+        changed = " ".join(["saved nodes (%s) %1.2f -> %1.2f" % (engine, old_saved[engine], saved[engine]) for engine in saved
+                            if engine in old_saved and abs(old_saved[engine] - saved[engine]) > 1e-9])
+        print("  %-16s %8d %-24s time %1.2fx memory %6s %s" % (record["graph type"], record["size"], record["step"],
+                                                            record["time"]/old["time"], memory, changed))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark solvers and the simulator on generated graphs of increasing size")
+    parser.add_argument("-t", "--graph_types", type=str, nargs="*", default=list(GRAPHS), choices=list(GRAPHS))
+    parser.add_argument("-n", "--sizes", type=int, nargs="*", default=[1000, 2000, 4000], help="approximate numbers of nodes")
+    parser.add_argument("-a", "--algorithms", type=str, default=None, help="JSON list of algorithms as in run_batch.py configs")
+    parser.add_argument("-k", "--nodes_to_block", type=int, default=10)
+    parser.add_argument("-s", "--number_of_seeds", type=int, default=5)
+    parser.add_argument("-b", "--both_directions", type=int, default=0)
+    parser.add_argument("-w", "--weight_scale", type=float, default=0.3)
+    parser.add_argument("-j", "--simulation_iterations", type=int, default=1000)
+    parser.add_argument("-e", "--engines", type=str, nargs="*", default=["csr"], choices=Simulator.ENGINES,
+                        help="simulation engines, every one evaluates all blocked sets, none to time only the solvers")
+    parser.add_argument("--workers", type=int, default=1, help="simulation processes")
+    parser.add_argument("-r", "--repeats", type=int, default=1, help="timed runs of every step, the minimum time is reported")
+    parser.add_argument("--no_memory", action="store_true", help="do not measure peak memory")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--cache_dir", type=str, default=None, help="reuse graphs generated before with the same parameters and seed")
+    parser.add_argument("-o", "--outfile", type=str, default="benchmark.json")
+    parser.add_argument("-c", "--compare", type=str, default=None, help="report of an earlier run to compare with")
+    args = parser.parse_args()
+
+    algorithms = get_algorithms({"algorithms": ALGORITHMS if args.algorithms is None else json.loads(args.algorithms)})
+    records = []
+    for graph_type in args.graph_types:
+        for size in args.sizes:
+            records += benchmark_graph(graph_type, size, algorithms, args)
+    json.dump({"environment": get_environment(args), "records": records}, open(args.outfile, "w"), indent=1, default=float)
+    if args.compare is not None:
+        compare(records, json.load(open(args.compare)))
+    print("Report saved to {}.".format(args.outfile))
@@ -0,0 +1,65 @@
+'''
+Checks that simulations with the world cache give the same results as without it, for every estimator
+and for numbers of iterations that are not multiples of the chunk size, so that worlds of partial chunks
+are stored and read back.
+'''
+
+import os
+import sys
+import argparse
+import json
+import tempfile
+import numpy as np
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from Generator import Generator
+from Simulator import Simulator
+from WorldCache import WorldCache
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that cached worlds give the same simulation results")
+    parser.add_argument("graph_type", type=str)
+    parser.add_argument("nodes_to_block", type=int)
+    parser.add_argument("-i", "--iterations", type=int, nargs="*", default=[15, 12, 25, 12, 15, 22, 40],
+                        help="iterations of consecutive runs on the same cache")
+    parser.add_argument("-s", "--number_of_seeds", type=int, default=1)
+    parser.add_argument("-w", "--weight_scale", type=float, default=1.)
+    parser.add_argument("-p", "--other_params", type=str, nargs="*")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+
+    params = {"graph_type": args.graph_type,
+              "both_directions": 0,
+              "weight_scale": args.weight_scale,
+              "random_weight": 1,
+              "seed": args.seed}
+    if args.other_params:
+        for i in range(int(len(args.other_params)/2)):
+            try:
+                params[args.other_params[2*i]] = int(args.other_params[2*i+1])
+            except ValueError:
+                params[args.other_params[2*i]] = float(args.other_params[2*i+1])
+
+    G = next(Generator(params).generate())
+    rng = np.random.default_rng(args.seed)
+    nodes = [node for node in G.nodes()]
+    seeds = rng.choice(nodes, args.number_of_seeds, replace=False)
+    blocked = rng.choice([node for node in nodes if node not in seeds], args.nodes_to_block, replace=False)
+
+    def simulate(iterations, estimator, world_cache=None):
+        simulator = Simulator(G, seeds, engine="csr", seed=args.seed, world_cache=world_cache, estimator=estimator)
+        simulator.add_blocked(0, blocked)
+        return simulator.run(iterations)
+
+    mismatches = 0
+    for estimator in Simulator.ESTIMATORS:
+        with tempfile.TemporaryDirectory() as path:
+            world_cache = WorldCache(path)
+            for iterations in args.iterations:
+                cached = simulate(iterations, estimator, world_cache)
+                # compared as JSON, where the undefined variance ratios of blocked sets saving no nodes are equal
+                same = json.dumps(cached['solvers']) == json.dumps(simulate(iterations, estimator)['solvers'])
+                mismatches += not same
+                print("%s, %d iterations (%d worlds cached before): identical results: %s" %
+                      (estimator, iterations, cached['world cache']['cached worlds'], same))
+    if mismatches > 0:
+        raise Exception("Cached worlds changed the results of %d runs" % mismatches)
@@ -0,0 +1,21 @@
+'''
+Converts a pickled NetworkX graph into a binary CSR store that run_solver.py can memory-map.
+'''
+
+import os
+import sys
+import argparse
+import pickle as pkl
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from CSRGraph import CSRGraph
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert a pickled graph into a CSR store")
+    parser.add_argument("graph", type=str)
+    parser.add_argument("store", type=str)
+    args = parser.parse_args()
+
+    G = pkl.load(open(args.graph, 'rb'))
+    csr = CSRGraph.from_networkx(G)
+    csr.save(args.store)
+    print("Saved graph with %d nodes and %d edges to %s." % (len(csr), csr.number_of_edges(), args.store))
@@ -0,0 +1,5 @@
+def set_in_set(subset, superset):
+    return all(n in superset for n in subset)
+
+def flatten(list_of_lists):
+    return [item for sublist in list_of_lists for item in sublist]
@@ -0,0 +1,154 @@
+'''
+Runs every algorithm for every k on every graph of an experiment config in one process.
+Each graph is loaded once, solvers of one algorithm share results that do not depend on k,
+and all blocked sets of a graph are evaluated by a single Simulator on the same sampled worlds.
+Greedy solvers run once for the largest k, and the solutions for all k are evaluated as prefixes of one sequence.
+
+Config (JSON):
+{
+    "graphs": [{"graph": "path_to_graph", "seeds": "path_to_seeds"}],
+    "algorithms": ["Degree", {"name": "Dom", "params": {"fast": 1}, "label": "DomFast"}],
+    "k": [1, 5, 10]
+}
+'''
+
+import os
+import sys
+import csv
+import time
+import json
+import argparse
+import numpy as np
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+from run_solver import *
+
+COLUMNS = ["graph", "algorithm", "k", "solver time", "saved nodes mean", "saved nodes var", "saved nodes confidence interval", "simulation iterations",
+           "fraction of saved nodes to active nodes mean", "fraction of saved nodes to active nodes var"]
+
+def get_algorithms(config):
+    algorithms = []
+    for algorithm in config["algorithms"]:
+        if isinstance(algorithm, str):
+            algorithm = {"name": algorithm}
+        algorithms.append((algorithm.get("label", algorithm["name"]), algorithm["name"], algorithm.get("params", {})))
+    if len(set([a[0] for a in algorithms])) < len(algorithms):
+        raise Exception("Algorithm labels must be unique")
+    return algorithms
+
+def run_graph(graph, seeds, algorithms, ks, args):
+    G = load_graph(graph)
+    seeds = np.atleast_1d(np.loadtxt(seeds))
+    pruning = None
+    if args.prune:
+        # all solvers and the simulator share the subgraph reachable from the seeds
+        G, pruning = (G if isinstance(G, CSRGraph) else CSRGraph.from_networkx(G)).prune(seeds)
+        print("Pruned the graph to %d nodes (%1.3f) and %d edges (%1.3f) reachable from the seeds." %
+              (pruning['nodes'], pruning['node ratio'], pruning['edges'], pruning['edge ratio']))
+        # budgets larger than the number of reachable nodes are reduced, and with no reachable node there is nothing to block
+        ks = sorted(set([min(k, len(G) - len(seeds)) for k in ks]) - set([0]))
+        if len(ks) == 0:
+            print("No nodes are reachable from the seeds, the graph is skipped.")
+            return []
+    nx_graph = None
+    logs = []
+    blocked_sets = []
+    sequences = []
+    for label, name, params in algorithms:
+        Solver = eval(name + "Solver")
+        graph_for_solver = G
+        if isinstance(G, CSRGraph) and not Solver.supports_csr:
+            # convert once for all solvers that need NetworkX
+            nx_graph = G.to_networkx() if nx_graph is None else nx_graph
+            graph_for_solver = nx_graph
+        cache = {}
+        ks = sorted(ks)
+        solver = Solver(graph_for_solver, seeds, ks[-1], cache=cache, **params)
+        if solver.prefix_solutions:
+            # one run for the largest k gives the solutions for all k, evaluated as prefixes of one sequence
+            sequence = solver.get_selection_sequence()
+            sequences.append((label, sequence))
+            for k in ks:
+                log = dict(solver.log, **{"Blocked nodes": sequence[:k], "Prefix of": ks[-1]})
+                logs.append({"graph": graph, "algorithm": label, "k": k, "log": log})
+            print("%s blocked %d nodes in %1.5fs." % (label, ks[-1], solver.log["Total time"]))
+            continue
+        for k in ks:
+            solver = Solver(graph_for_solver, seeds, k, cache=cache, **params)
+            solver.run()
+            blocked_sets.append(len(logs))
+            logs.append({"graph": graph, "algorithm": label, "k": k, "log": solver.log})
+            print("%s blocked %d nodes in %1.5fs." % (label, k, solver.log["Total time"]))
+
+    print("Running simulations for %d blocked sets and %d prefix sequences..." % (len(blocked_sets), len(sequences)))
+    simulator = Simulator(G, seeds, engine=args.engine, seed=args.seed, percentiles=args.percentiles,
+                          world_cache=get_world_cache(args), estimator=args.estimator)
+    for i in blocked_sets:
+        simulator.add_blocked(i, logs[i]["log"]["Blocked nodes"])
+    for label, sequence in sequences:
+        simulator.add_blocked_sequence(label, sequence)
+    results = simulator.run(args.simulation_iterations, workers=args.workers, absolute_error=args.absolute_error,
+                            relative_error=args.relative_error, confidence=args.confidence, time_budget=args.time_budget,
+                            min_iterations=args.min_iterations)
+    for entry in logs:
+        if entry["log"].get("Prefix of") is None:
+            continue
+        # a solver may block fewer nodes than k, then the whole sequence is evaluated
+        k = min(entry["k"], len(results['sequences'][entry["algorithm"]]))
+        entry["log"]["simulation"] = results['sequences'][entry["algorithm"]][k-1]
+        entry["log"]["saved nodes confidence interval"] = results['saved nodes confidence interval']['sequences'][entry["algorithm"]][k-1]
+    for i in blocked_sets:
+        logs[i]["log"]["simulation"] = results['solvers'][i]
+        logs[i]["log"]["saved nodes confidence interval"] = results['saved nodes confidence interval']['solvers'][i]
+    for entry in logs:
+        if pruning is not None:
+            entry["log"].setdefault("Pruning", pruning)
+        entry["log"]["simulation seed"] = results['seed']
+        entry["log"]["simulation iterations"] = results['iterations']
+    return logs
+
+def get_row(entry):
+    simulation = entry["log"]["simulation"]
+    # the confidence interval is of the estimate of the simulator's estimator, so are the mean and the variance
+    saved = simulation.get("saved nodes estimate", simulation["saved nodes"])
+    return [entry["graph"], entry["algorithm"], entry["k"], entry["log"]["Total time"],
+            saved["mean"], saved["var"],
+            entry["log"]["saved nodes confidence interval"], entry["log"]["simulation iterations"],
+            simulation["fraction of saved nodes to active nodes"]["mean"], simulation["fraction of saved nodes to active nodes"]["var"]]
+
+if __name__ == "__main__":
+    t1 = time.time()
+    parser = argparse.ArgumentParser(description="Run all algorithms for all k on all graphs of an experiment config")
+    parser.add_argument("config", type=str)
+    parser.add_argument("-j", "--simulation_iterations", type=int, default="100")
+    parser.add_argument("-e", "--engine", type=str, default="networkx", choices=Simulator.ENGINES)
+    parser.add_argument("-w", "--workers", type=int, default=1)
+    parser.add_argument("-s", "--seed", type=int, default=None)
+    parser.add_argument("--absolute_error", type=float, default=None, help="stop when the confidence interval of saved nodes is within this error")
+    parser.add_argument("--relative_error", type=float, default=None, help="stop when the confidence interval of saved nodes is within this fraction of the mean")
+    parser.add_argument("--confidence", type=float, default=0.95)
+    parser.add_argument("--min_iterations", type=int, default=500, help="iterations before the precision target is checked")
+    parser.add_argument("--time_budget", type=float, default=None, help="stop simulations after this many seconds")
+    parser.add_argument("--percentiles", type=float, nargs="*", default=[5, 50, 95], help="percentiles of saved nodes to report")
+    parser.add_argument("--estimator", type=str, default="plain", choices=Simulator.ESTIMATORS, help="variance reduction of the saved nodes estimate (csr engine)")
+    parser.add_argument("--world_cache", type=str, default=None, help="directory of sampled worlds reused by runs with the same graph, seeds and seed (csr engine)")
+    parser.add_argument("--world_cache_size", type=float, default=None, help="size limit of the world cache directory in GB")
+    parser.add_argument("--prune", action="store_true", help="run solvers and simulations only on the subgraph reachable from the seeds")
+    parser.add_argument("-o", "--outfile", type=str, default="results.csv")
+    parser.add_argument("-l", "--logfile", type=str, default=None)
+    args = parser.parse_args()
+
+    config = json.load(open(args.config))
+    algorithms = get_algorithms(config)
+    logs = []
+    for entry in config["graphs"]:
+        print("Graph %s:" % entry["graph"])
+        logs += run_graph(entry["graph"], entry["seeds"], algorithms, config["k"], args)
+
+    with open(args.outfile, "w", newline="") as f:
+        writer = csv.writer(f)
+        writer.writerow(COLUMNS)
+        writer.writerows([get_row(entry) for entry in logs])
+    if args.logfile is not None:
+        json.dump(logs, open(args.logfile, "w"), default=float)
+    print("Total time: %1.5fs" % (time.time() - t1))
+    print("Results saved to {}.".format(args.outfile))
@@ -5,13 +5,43 @@ import argparse
 import numpy as np
 import json
 import pickle as pkl
+import multiprocessing
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 from DegreeSolver import *
 from DomSolver import *
 from RandomSolver import *
 from NetShapeSolver import *
 from NetShieldSolver import *
+from RRSolver import *
 from Simulator import *
+from Generator import Generator
+
+def load_graph(path):
+    # binary CSR stores are memory-mapped, anything else is a pickled NetworkX graph
+    if CSRGraph.is_store(path):
+        return CSRGraph.load(path)
+    return pkl.load(open(path,'rb'))
+
+def analyze_graph(path, clustering_samples):
+    return Generator.get_graph_stats(load_graph(path), clustering_samples)
+
+def get_world_cache(args):
+    if args.world_cache is None:
+        return None
+    return WorldCache(args.world_cache, None if args.world_cache_size is None else int(args.world_cache_size*2**30))
+
+def parse_params(other_params):
+    params = {}
+    if other_params:
+        for i in range(int(len(other_params)/2)):
+            value = other_params[2*i+1]
+            for parse in [int, float, str]:
+                try:
+                    params[other_params[2*i]] = parse(value)
+                    break
+                except ValueError:
+                    continue
+    return params
 
 if __name__ == "__main__":
     t1 = time.time()
@@ -21,31 +51,70 @@ if __name__ == "__main__":
     parser.add_argument("nodes_to_block", type=int)
     parser.add_argument("algorithm", type=str)
     parser.add_argument("-j", "--simulation_iterations", type=int, default="100")
+    parser.add_argument("-e", "--engine", type=str, default="networkx", choices=Simulator.ENGINES)
+    parser.add_argument("-w", "--workers", type=int, default=1)
+    parser.add_argument("-s", "--seed", type=int, default=None)
+    parser.add_argument("--absolute_error", type=float, default=None, help="stop when the confidence interval of saved nodes is within this error")
+    parser.add_argument("--relative_error", type=float, default=None, help="stop when the confidence interval of saved nodes is within this fraction of the mean")
+    parser.add_argument("--confidence", type=float, default=0.95)
+    parser.add_argument("--min_iterations", type=int, default=500, help="iterations before the precision target is checked")
+    parser.add_argument("--time_budget", type=float, default=None, help="stop simulations after this many seconds")
+    parser.add_argument("--percentiles", type=float, nargs="*", default=[5, 50, 95], help="percentiles of saved nodes to report")
+    parser.add_argument("--estimator", type=str, default="plain", choices=Simulator.ESTIMATORS, help="variance reduction of the saved nodes estimate (csr engine)")
+    parser.add_argument("--world_cache", type=str, default=None, help="directory of sampled worlds reused by runs with the same graph, seeds and seed (csr engine)")
+    parser.add_argument("--world_cache_size", type=float, default=None, help="size limit of the world cache directory in GB")
     parser.add_argument("-o", "--outfile", type=str, default="a.out")
+    parser.add_argument("-n", "--node_counts", type=str, default=None, help="write per-node activation counts to this .npz file")
+    parser.add_argument("--prune", action="store_true", help="run the solver and simulations only on the subgraph reachable from the seeds")
+    parser.add_argument("-a", "--analyze", type=int, default=None, metavar="CLUSTERING_SAMPLES",
+                        help="compute graph statistics in a separate process while the solver runs")
     parser.add_argument("-p", "--other_params", type=str, nargs="*")
     args = parser.parse_args()
 
-    G, seeds = pkl.load(open(args.graph,'rb')), np.atleast_1d(np.loadtxt(args.seeds))
+    G, seeds = load_graph(args.graph), np.atleast_1d(np.loadtxt(args.seeds))
     k = args.nodes_to_block
-    problem_params = {}
-    if args.other_params:
-        for i in range(int(len(args.other_params)/2)):
-            if args.problem_params[2*i+1].isdigit():
-                problem_params[args.other_params[2*i]] = int(args.other_params[2*i+1])
-            else:
-                problem_params[args.other_params[2*i]] = args.other_params[2*i+1]
-    z = dict(problem_params)
+    z = parse_params(args.other_params)
+    if args.prune:
+        G, pruning = (G if isinstance(G, CSRGraph) else CSRGraph.from_networkx(G)).prune(seeds)
+        print("Pruned the graph to %d nodes (%1.3f) and %d edges (%1.3f) reachable from the seeds." %
+              (pruning['nodes'], pruning['node ratio'], pruning['edges'], pruning['edge ratio']))
+        k = min(k, len(G) - len(seeds))
+
+    if args.analyze is not None:
+        analysis_pool = multiprocessing.Pool(1)
+        analysis = analysis_pool.apply_async(analyze_graph, (args.graph, args.analyze))
 
     Solver = eval(args.algorithm + "Solver")
-    solver = Solver(G, seeds, k, **z)
-    solver.run()
-    print("%s blocked %d nodes in a graph of size %d." % (solver.get_name(), k, len(G)))
+    if k > 0:
+        solver = Solver(G, seeds, k, **z)
+        solver.run()
+        log = solver.log
+        print("%s blocked %d nodes in a graph of size %d." % (solver.get_name(), k, len(G)))
+    else:
+        # only the seeds are reachable, no node can be saved
+        log = {"Blocked nodes": [], "Total time": 0.}
+        print("No nodes are reachable from the seeds, no nodes are blocked.")
     print("Running simulations...")
 
-    simulator = Simulator(G, seeds)
-    simulator.add_blocked(0, solver.log['Blocked nodes'])
-    results = simulator.run(args.simulation_iterations)
-    solver.log.update({"simulation": results['solvers'][0]})
-    json.dump(solver.log, open(args.outfile, "w"))
-    print("Solver Time: %1.5fs; Objective (saved): %1.1f; Total time: %1.5s" % (solver.log["Total time"], results['solvers'][0]["saved nodes"]["mean"], (time.time() - t1)))
+    simulator = Simulator(G, seeds, engine=args.engine, seed=args.seed, percentiles=args.percentiles,
+                          node_counts=args.node_counts is not None, world_cache=get_world_cache(args),
+                          estimator=args.estimator)
+    simulator.add_blocked(0, log['Blocked nodes'])
+    results = simulator.run(args.simulation_iterations, workers=args.workers, absolute_error=args.absolute_error,
+                            relative_error=args.relative_error, confidence=args.confidence, time_budget=args.time_budget,
+                            min_iterations=args.min_iterations)
+    log.update({"simulation": results['solvers'][0], "simulation seed": results['seed'], "simulation iterations": results['iterations'],
+                "saved nodes confidence interval": results['saved nodes confidence interval']['solvers'][0]})
+    if args.prune:
+        log.setdefault("Pruning", pruning)
+    if args.world_cache is not None:
+        log["world cache"] = results['world cache']
+    if args.analyze is not None:
+        log["graph stats"] = analysis.get()
+        analysis_pool.close()
+    json.dump(log, open(args.outfile, "w"))
+    if args.node_counts is not None:
+        simulator.save_activation_counts(args.node_counts)
+    saved = results['solvers'][0].get("saved nodes estimate", results['solvers'][0]["saved nodes"])
+    print("Solver Time: %1.5fs; Objective (saved): %1.1f; Total time: %1.5s" % (log["Total time"], saved["mean"], (time.time() - t1)))
     print("Logs saved to {}.".format(args.outfile))